@@ -17,7 +17,7 @@ sys.path.append(os.getcwd())
 
 # Импортируем наши модели и настройки
 from app.database import Base
-from app.models import User, CompanySettings, Product  # Важно импортировать все модели!
+from app.models import User, CompanySettings, Product, Order, DailyStat, SyncState  # Важно импортировать все модели!
 
 # Загружаем переменные из .env
 load_dotenv()
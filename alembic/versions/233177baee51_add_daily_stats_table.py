@@ -0,0 +1,38 @@
+"""Add daily_stats table
+
+Revision ID: 233177baee51
+Revises: 81a67696fe81
+Create Date: 2026-10-18 09:12:04.518231
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '233177baee51'
+down_revision: Union[str, Sequence[str], None] = '81a67696fe81'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('daily_stats',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('revenue', sa.Float(), nullable=True),
+    sa.Column('profit', sa.Float(), nullable=True),
+    sa.Column('orders_count', sa.Integer(), nullable=True),
+    sa.Column('without_costs', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'day')
+    )
+    # Заполнить таблицу для существующих пользователей: python -m app.cli rebuild-rollups
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('daily_stats')
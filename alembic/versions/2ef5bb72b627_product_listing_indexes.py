@@ -0,0 +1,39 @@
+"""Product listing indexes
+
+Revision ID: 2ef5bb72b627
+Revises: 9be803176538
+Create Date: 2026-10-18 11:26:15.330187
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2ef5bb72b627'
+down_revision: Union[str, Sequence[str], None] = '9be803176538'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index('ix_products_user_id_id', 'products', ['user_id', 'id'], unique=False)
+    op.create_index(
+        'ix_products_user_id_sku_prefix', 'products', ['user_id', 'sku'], unique=False,
+        postgresql_ops={'sku': 'text_pattern_ops'},
+    )
+    op.create_index(
+        'ix_products_name_trgm', 'products', ['name'], unique=False,
+        postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'},
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_products_name_trgm', table_name='products')
+    op.drop_index('ix_products_user_id_sku_prefix', table_name='products')
+    op.drop_index('ix_products_user_id_id', table_name='products')
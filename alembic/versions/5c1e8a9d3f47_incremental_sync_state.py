@@ -0,0 +1,37 @@
+"""Incremental sync state
+
+Revision ID: 5c1e8a9d3f47
+Revises: 2ef5bb72b627
+Create Date: 2026-10-18 13:02:41.207316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c1e8a9d3f47'
+down_revision: Union[str, Sequence[str], None] = '2ef5bb72b627'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('orders', sa.Column('row_hash', sa.BigInteger(), nullable=True))
+    op.create_table('sync_states',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('last_order_date', sa.DateTime(), nullable=True),
+    sa.Column('last_synced_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    # Старые заказы без отпечатка один раз сверятся как "измененные" при следующем синке
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('sync_states')
+    op.drop_column('orders', 'row_hash')
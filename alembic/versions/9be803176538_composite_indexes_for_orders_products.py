@@ -0,0 +1,56 @@
+"""Composite indexes for orders/products
+
+Revision ID: 9be803176538
+Revises: 233177baee51
+Create Date: 2026-10-18 10:03:47.902114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9be803176538'
+down_revision: Union[str, Sequence[str], None] = '233177baee51'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Уникальные ключи не создадутся, если дубли уже есть - оставляем самую раннюю запись
+    op.execute("""
+        DELETE FROM orders a USING orders b
+        WHERE a.user_id = b.user_id AND a.kaspi_id = b.kaspi_id AND a.id > b.id
+    """)
+    op.execute("""
+        DELETE FROM products a USING products b
+        WHERE a.user_id = b.user_id AND a.sku = b.sku AND a.id > b.id
+    """)
+
+    op.create_index('ix_orders_user_id_order_date', 'orders', ['user_id', 'order_date'], unique=False)
+    op.create_index('ix_orders_user_id_sku', 'orders', ['user_id', 'sku'], unique=False)
+    op.create_unique_constraint('uq_orders_user_id_kaspi_id', 'orders', ['user_id', 'kaspi_id'])
+    op.create_unique_constraint('uq_products_user_id_sku', 'products', ['user_id', 'sku'])
+
+    # Одиночные индексы покрыты составными (всегда ищем внутри пользователя)
+    op.drop_index(op.f('ix_orders_sku'), table_name='orders')
+    op.drop_index(op.f('ix_orders_kaspi_id'), table_name='orders')
+    op.drop_index(op.f('ix_products_sku'), table_name='products')
+
+    # Join заказов с товарами теперь внутри пользователя - итоги по дням надо пересчитать:
+    # python -m app.cli rebuild-rollups
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index(op.f('ix_products_sku'), 'products', ['sku'], unique=False)
+    op.create_index(op.f('ix_orders_kaspi_id'), 'orders', ['kaspi_id'], unique=False)
+    op.create_index(op.f('ix_orders_sku'), 'orders', ['sku'], unique=False)
+
+    op.drop_constraint('uq_products_user_id_sku', 'products', type_='unique')
+    op.drop_constraint('uq_orders_user_id_kaspi_id', 'orders', type_='unique')
+    op.drop_index('ix_orders_user_id_sku', table_name='orders')
+    op.drop_index('ix_orders_user_id_order_date', table_name='orders')
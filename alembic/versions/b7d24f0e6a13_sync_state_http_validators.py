@@ -0,0 +1,32 @@
+"""Sync state source url and HTTP validators
+
+Revision ID: b7d24f0e6a13
+Revises: 5c1e8a9d3f47
+Create Date: 2026-10-18 13:48:19.664082
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d24f0e6a13'
+down_revision: Union[str, Sequence[str], None] = '5c1e8a9d3f47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('sync_states', sa.Column('source_url', sa.String(), nullable=True))
+    op.add_column('sync_states', sa.Column('etag', sa.String(), nullable=True))
+    op.add_column('sync_states', sa.Column('last_modified', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('sync_states', 'last_modified')
+    op.drop_column('sync_states', 'etag')
+    op.drop_column('sync_states', 'source_url')
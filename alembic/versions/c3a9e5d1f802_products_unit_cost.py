@@ -0,0 +1,44 @@
+"""Products unit_cost and has_costs generated columns
+
+Revision ID: c3a9e5d1f802
+Revises: e41f9c2a7b58
+Create Date: 2026-10-18 16:02:44.218305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3a9e5d1f802'
+down_revision: Union[str, Sequence[str], None] = 'e41f9c2a7b58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Копия формул из app/models.py на момент миграции
+UNIT_COST_SQL = (
+    "coalesce(purchase_price, 0) + coalesce(logistics_china, 0) + coalesce(logistics_inner, 0)"
+    " + coalesce(packaging_cost, 0) + coalesce(other_expenses, 0)"
+)
+HAS_COSTS_SQL = "coalesce(purchase_price, 0) <> 0"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # packaging_cost есть в модели, но в ранних миграциях ее не было
+    op.execute("ALTER TABLE products ADD COLUMN IF NOT EXISTS packaging_cost FLOAT DEFAULT 0")
+    op.execute("UPDATE products SET packaging_cost = 0 WHERE packaging_cost IS NULL")
+
+    op.add_column('products', sa.Column('unit_cost', sa.Float(), sa.Computed(UNIT_COST_SQL, persisted=True), nullable=True))
+    op.add_column('products', sa.Column('has_costs', sa.Boolean(), sa.Computed(HAS_COSTS_SQL, persisted=True), nullable=True))
+    op.create_index('ix_products_user_id_has_costs', 'products', ['user_id', 'has_costs'], unique=False)
+    # Прибыль теперь учитывает other_expenses - итоги по дням пересчитать: python -m app.cli rebuild-rollups
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_products_user_id_has_costs', table_name='products')
+    op.drop_column('products', 'has_costs')
+    op.drop_column('products', 'unit_cost')
@@ -0,0 +1,112 @@
+"""Partition orders by month on order_date
+
+Revision ID: e41f9c2a7b58
+Revises: b7d24f0e6a13
+Create Date: 2026-10-18 15:21:07.913554
+
+"""
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e41f9c2a7b58'
+down_revision: Union[str, Sequence[str], None] = 'b7d24f0e6a13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Сколько месяцев вперед создать сразу (дальше - приложение, см. app/services/partitions.py)
+MONTHS_AHEAD = 3
+
+COLUMNS = "id, user_id, kaspi_id, sku, product_name, amount, status, order_date, quantity, delivery_cost_for_seller, row_hash"
+
+
+def _add_months(d: date, months: int) -> date:
+    index = d.year * 12 + d.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _create_orders_table(partitioned: bool) -> None:
+    primary_key = "PRIMARY KEY (id, order_date)" if partitioned else "PRIMARY KEY (id)"
+    unique = "(user_id, kaspi_id, order_date)" if partitioned else "(user_id, kaspi_id)"
+    unique_name = "uq_orders_user_id_kaspi_id_order_date" if partitioned else "uq_orders_user_id_kaspi_id"
+    op.execute(f"""
+        CREATE TABLE orders (
+            id INTEGER NOT NULL DEFAULT nextval('orders_id_seq'),
+            user_id INTEGER REFERENCES users (id),
+            kaspi_id VARCHAR,
+            sku VARCHAR,
+            product_name VARCHAR,
+            amount FLOAT,
+            status VARCHAR,
+            order_date TIMESTAMP WITHOUT TIME ZONE {"NOT NULL" if partitioned else ""},
+            quantity INTEGER,
+            delivery_cost_for_seller FLOAT,
+            row_hash BIGINT,
+            {primary_key},
+            CONSTRAINT {unique_name} UNIQUE {unique}
+        ) {"PARTITION BY RANGE (order_date)" if partitioned else ""}
+    """)
+    op.execute("ALTER SEQUENCE orders_id_seq OWNED BY orders.id")
+    # На секционированной таблице индексы создаются сразу во всех секциях
+    op.create_index('ix_orders_id', 'orders', ['id'], unique=False)
+    op.create_index('ix_orders_user_id_order_date', 'orders', ['user_id', 'order_date'], unique=False)
+    op.create_index('ix_orders_user_id_sku', 'orders', ['user_id', 'sku'], unique=False)
+
+
+def _detach_old_table() -> None:
+    # Старая таблица уходит в orders_old; ее ключи и индексы освобождают имена для новой
+    op.execute("ALTER SEQUENCE orders_id_seq OWNED BY NONE")
+    op.execute("ALTER TABLE orders RENAME TO orders_old")
+    op.execute("ALTER TABLE orders_old DROP CONSTRAINT IF EXISTS uq_orders_user_id_kaspi_id")
+    op.execute("ALTER TABLE orders_old DROP CONSTRAINT IF EXISTS uq_orders_user_id_kaspi_id_order_date")
+    op.execute("ALTER TABLE orders_old DROP CONSTRAINT IF EXISTS orders_pkey")
+    for index in ('ix_orders_id', 'ix_orders_user_id_order_date', 'ix_orders_user_id_sku'):
+        op.execute(f"DROP INDEX IF EXISTS {index}")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # quantity есть в модели, но в ранних миграциях ее не было
+    op.execute("ALTER TABLE orders ADD COLUMN IF NOT EXISTS quantity INTEGER DEFAULT 1")
+    # Ключ секционирования не может быть NULL - такие заказы (если есть) уходят в 1970-01-01
+    op.execute("UPDATE orders SET order_date = '1970-01-01' WHERE order_date IS NULL")
+
+    # Секции - с первого месяца реальных данных; 1970-01-01 и прочий мусор уйдет в orders_default
+    bounds = op.get_bind().execute(sa.text(
+        "SELECT min(order_date), max(order_date) FROM orders WHERE order_date >= '2000-01-01'"
+    )).one()
+
+    _detach_old_table()
+    _create_orders_table(partitioned=True)
+
+    op.execute("CREATE TABLE orders_default PARTITION OF orders DEFAULT")
+    first = date(bounds[0].year, bounds[0].month, 1) if bounds[0] else date.today().replace(day=1)
+    last = _add_months(max(bounds[1].date() if bounds[1] else date.today(), date.today()).replace(day=1), MONTHS_AHEAD)
+    month = first
+    while month <= last:
+        name = f"orders_y{month.year:04d}m{month.month:02d}"
+        op.execute(
+            f"CREATE TABLE {name} PARTITION OF orders "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+        )
+        month = _add_months(month, 1)
+
+    op.execute(f"INSERT INTO orders ({COLUMNS}) SELECT {COLUMNS} FROM orders_old")
+    op.execute("DROP TABLE orders_old")
+    op.execute("ANALYZE orders")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _detach_old_table()
+    _create_orders_table(partitioned=False)
+    # Дубли (user_id, kaspi_id) с разными датами в обычной таблице не поместятся - берем самый ранний id
+    op.execute(f"""
+        INSERT INTO orders ({COLUMNS})
+        SELECT DISTINCT ON (user_id, kaspi_id) {COLUMNS} FROM orders_old ORDER BY user_id, kaspi_id, id
+    """)
+    op.execute("DROP TABLE orders_old CASCADE")
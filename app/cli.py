@@ -0,0 +1,112 @@
+"""Служебные команды.
+
+    python -m app.cli rebuild-rollups               # все пользователи
+    python -m app.cli rebuild-rollups --user-id 42  # один пользователь
+    python -m app.cli explain-dashboard --user-id 42 --days 90  # EXPLAIN ANALYZE агрегата дашборда
+    python -m app.cli ensure-partitions --months-ahead 6         # секции orders наперед
+    python -m app.cli detach-partitions --before 2024-01 --archive-schema archive
+"""
+import argparse
+import asyncio
+from datetime import date, datetime, timedelta
+
+from sqlalchemy.future import select
+
+from app.core.sql import explain
+from app.database import AsyncSessionLocal, engine
+from app.models import User
+from app.services import partitions
+from app.services.rollups import rebuild_user
+from app.services.stats import daily_stats_query, get_tax_percent
+
+
+async def rebuild_rollups(user_id: int = None) -> None:
+    async with AsyncSessionLocal() as db:
+        if user_id is None:
+            result = await db.execute(select(User.id).order_by(User.id))
+            user_ids = result.scalars().all()
+        else:
+            user_ids = [user_id]
+
+        # Каждый пользователь - отдельная транзакция, чтобы не держать блокировки на всю базу
+        for uid in user_ids:
+            await rebuild_user(db, uid)
+            await db.commit()
+            print(f"user {uid}: daily_stats rebuilt")
+
+
+async def explain_dashboard(user_id: int, days: int) -> None:
+    # План запроса по сырым заказам (им же строятся итоги) - для сравнения до/после индексов
+    async with AsyncSessionLocal() as db:
+        tax_percent = await get_tax_percent(db, user_id)
+        query = daily_stats_query(user_id, tax_percent, datetime.now() - timedelta(days=days))
+        result = await db.execute(explain(query, "ANALYZE, BUFFERS"))
+        for line in result.scalars():
+            print(line)
+
+
+async def ensure_partitions(months_ahead: int) -> None:
+    created = await partitions.ensure_future(engine, months_ahead)
+    print("created: " + (", ".join(created) if created else "nothing"))
+
+
+async def detach_partitions(before: date, archive_schema: str, drop: bool, dry_run: bool) -> None:
+    if dry_run:
+        names = [
+            name for name in await partitions.list_partitions(engine)
+            if (partitions.partition_month(name) or before) < before
+        ]
+        print("would detach: " + (", ".join(names) if names else "nothing"))
+        return
+    detached = await partitions.detach_before(engine, before, archive_schema=archive_schema, drop=drop)
+    print("detached: " + (", ".join(detached) if detached else "nothing"))
+
+
+def _month(value: str) -> date:
+    return datetime.strptime(value, "%Y-%m").date()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rollups = commands.add_parser("rebuild-rollups", help="Пересчитать daily_stats из orders")
+    rollups.add_argument("--user-id", type=int, default=None)
+
+    explain = commands.add_parser("explain-dashboard", help="EXPLAIN ANALYZE запроса дашборда")
+    explain.add_argument("--user-id", type=int, required=True)
+    explain.add_argument("--days", type=int, default=30)
+
+    ensure = commands.add_parser("ensure-partitions", help="Создать секции orders на текущий и следующие месяцы")
+    ensure.add_argument("--months-ahead", type=int, default=None)
+
+    detach = commands.add_parser(
+        "detach-partitions",
+        help="Отсоединить секции orders старше месяца (итоги daily_stats за эти дни остаются)",
+    )
+    detach.add_argument("--before", type=_month, required=True, help="YYYY-MM: секции раньше этого месяца")
+    target = detach.add_mutually_exclusive_group()
+    target.add_argument("--archive-schema", help="Перенести отсоединенные таблицы в эту схему")
+    target.add_argument("--drop", action="store_true", help="Удалить отсоединенные таблицы")
+    detach.add_argument("--dry-run", action="store_true")
+
+    args = parser.parse_args()
+
+    async def run():
+        try:
+            if args.command == "rebuild-rollups":
+                await rebuild_rollups(args.user_id)
+            elif args.command == "explain-dashboard":
+                await explain_dashboard(args.user_id, args.days)
+            elif args.command == "ensure-partitions":
+                await ensure_partitions(args.months_ahead)
+            elif args.command == "detach-partitions":
+                await detach_partitions(args.before, args.archive_schema, args.drop, args.dry_run)
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
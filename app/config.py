@@ -10,9 +10,70 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60
     ALGORITHM: str = "HS256"
 
+    # Кэш пользователей в get_current_user (email -> id, is_active)
+    AUTH_CACHE_TTL_SECONDS: int = 60
+    AUTH_CACHE_MAX_ENTRIES: int = 10000
+
+    # bcrypt в пуле потоков и лимит попыток входа на аккаунт
+    PASSWORD_HASH_WORKERS: int = 4
+    LOGIN_MAX_ATTEMPTS: int = 10
+    LOGIN_WINDOW_SECONDS: int = 300
+
+    # Запросы дольше порога пишутся в лог с разбивкой по SQL
+    SLOW_REQUEST_MS: int = 500
+
     # Читаем DATABASE_URL из .env
     DATABASE_URL: str = os.getenv("DATABASE_URL")
 
+    # Движок БД. echo=True пишет каждый запрос в лог - только для отладки
+    DB_ECHO: bool = False
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: int = 30          # Сколько секунд ждать свободное соединение
+    DB_POOL_RECYCLE: int = 1800        # Пересоздавать соединения старше N секунд
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_TIMEOUT_MS: int = 30000
+    DB_STATEMENT_CACHE_SIZE: int = 100  # Кэш prepared statements в asyncpg (0 - для pgbouncer)
+
+    # Секции orders по месяцам: сколько месяцев вперед создавать заранее
+    ORDERS_PARTITION_MONTHS_AHEAD: int = 3
+    # Сколько ждать блокировку orders при создании секции; не дождались - заказы идут в orders_default,
+    # а этот месяц процесс снова пробует не раньше чем через ORDERS_PARTITION_RETRY_SECONDS
+    ORDERS_PARTITION_LOCK_TIMEOUT_MS: int = 5000
+    ORDERS_PARTITION_RETRY_SECONDS: int = 600
+
+    # Импорт: сколько строк CSV читаем за раз (пик памяти не зависит от размера файла)
+    IMPORT_CHUNK_ROWS: int = 5000
+
+    # Фоновая синхронизация: сколько импортов идет одновременно и сколько помним готовые задачи
+    SYNC_MAX_CONCURRENCY: int = 2
+    SYNC_JOB_TTL_SECONDS: int = 3600
+
+    # Скачивание выгрузки: таймаут на операцию (чтение куска, запись), на соединение, потолок размера
+    DOWNLOAD_TIMEOUT_SECONDS: int = 60
+    DOWNLOAD_CONNECT_TIMEOUT_SECONDS: int = 10
+    DOWNLOAD_MAX_BYTES: int = 200 * 1024 * 1024
+    DOWNLOAD_SPOOL_MEMORY_BYTES: int = 8 * 1024 * 1024   # Больше - временный файл на диске
+    DOWNLOAD_MAX_CONNECTIONS: int = 10
+
+    # Автосинк по CompanySettings.google_sheet_url. Планировщик живет в каждом процессе, но синкает
+    # только тот, кто взял advisory lock в Postgres (остальные воркеры ждут и подхватят, если он упадет)
+    AUTO_SYNC_ENABLED: bool = True
+    # Сколько автосинков одновременно; урезается до SYNC_MAX_CONCURRENCY - 1 - слот под ручной POST /sync
+    AUTO_SYNC_MAX_CONCURRENCY: int = 1
+    AUTO_SYNC_INTERVAL_SECONDS: int = 3600
+    AUTO_SYNC_JITTER: float = 0.1                 # +-10% к интервалу, чтобы пользователи не шли пачкой
+    AUTO_SYNC_MAX_BACKOFF_SECONDS: int = 6 * 3600  # Потолок паузы после ошибок подряд
+    AUTO_SYNC_TICK_SECONDS: int = 30              # Как часто планировщик проверяет, кому пора
+
+    # Кэш дашборда (user_id, days)
+    DASHBOARD_CACHE_TTL_SECONDS: int = 60
+    DASHBOARD_CACHE_MAX_ENTRIES: int = 10000
+
+    # Массивы заказов для "что если" расчетов: сколько пользователей держим в памяти и сколько
+    COLUMNAR_MAX_TENANTS: int = 50
+    COLUMNAR_TTL_SECONDS: int = 3600
+
     class Config:
         case_sensitive = True
 
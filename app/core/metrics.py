@@ -0,0 +1,247 @@
+"""Метрики в текстовом формате Prometheus (без prometheus_client) и учет запросов к БД на HTTP-запрос.
+
+Запросы к БД считаем через события движка SQLAlchemy. Счетчик текущего HTTP-запроса лежит
+в contextvar: SQLAlchemy переносит контекст в свой greenlet, так что события его видят.
+"""
+import bisect
+import logging
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.config import settings
+from app.database import pool_stats, pool_status
+from app.services.cache import named_caches
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# Сколько разных SQL держим в разбивке одного запроса (для лога медленных)
+BREAKDOWN_MAX_STATEMENTS = 20
+
+
+def _labels(names: Sequence[str], values: Tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{str(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = Lock()
+
+    def inc(self, *labels, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    def dec(self, *labels) -> None:
+        self.inc(*labels, amount=-1.0)
+
+    def render(self) -> list:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Sequence[float], labels: Sequence[str] = ()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple, list] = {}  # labels -> [counts по бакетам..., +Inf, sum]
+        self._lock = Lock()
+
+    def observe(self, value: float, *labels) -> None:
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect.bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.label_names + ("le",)
+        for labels, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(names, labels + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {series[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class Collected:
+    """Счетчик или gauge, который снимается при отдаче /metrics: collect() -> {метки: значение}.
+    Для того, что уже считают сами (пул соединений, кэши), - без второго учета на горячем пути."""
+
+    def __init__(self, name: str, help: str, kind: str, collect: Callable[[], Dict[Tuple, float]], labels: Sequence[str] = ()):
+        self.name, self.help, self.kind, self.label_names = name, help, kind, tuple(labels)
+        self.collect = collect
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+def _pool(key: str) -> Callable[[], Dict[Tuple, float]]:
+    # checked_out / saturation есть только у пула Postgres (на SQLite - пусто)
+    def collect():
+        status = pool_status()
+        return {(): status[key]} if key in status else {}
+    return collect
+
+
+def _caches(key: str) -> Callable[[], Dict[Tuple, float]]:
+    return lambda: {(name,): cache.stats()[key] for name, cache in named_caches.items()}
+
+
+http_requests = Counter("http_requests_total", "HTTP requests", ["method", "route", "status"])
+http_latency = Histogram("http_request_duration_seconds", "HTTP request latency", LATENCY_BUCKETS, ["method", "route"])
+http_in_flight = Gauge("http_requests_in_flight", "HTTP requests being served")
+http_db_queries = Histogram("http_request_db_queries", "DB queries per HTTP request", QUERY_COUNT_BUCKETS, ["method", "route"])
+http_db_seconds = Histogram("http_request_db_seconds", "DB time per HTTP request", LATENCY_BUCKETS, ["method", "route"])
+db_query_latency = Histogram("db_query_duration_seconds", "DB query latency (all queries)", LATENCY_BUCKETS)
+import_stage_latency = Histogram("import_stage_duration_seconds", "Sync import stage time", STAGE_BUCKETS, ["stage"])
+
+db_pool_checkouts = Collected("db_pool_checkouts_total", "Connections taken from the pool", "counter", lambda: {(): pool_stats.checkouts})
+db_pool_wait = Collected("db_pool_checkout_wait_seconds_total", "Time spent waiting for a pool connection", "counter", lambda: {(): pool_stats.wait_total})
+db_pool_wait_max = Collected("db_pool_checkout_wait_max_seconds", "Longest wait for a pool connection", "gauge", lambda: {(): pool_stats.wait_max})
+db_pool_timeouts = Collected("db_pool_checkout_timeouts_total", "Pool checkouts that timed out", "counter", lambda: {(): pool_stats.timeouts})
+db_pool_checked_out = Collected("db_pool_checked_out", "Connections currently checked out", "gauge", _pool("checked_out"))
+db_pool_saturation = Collected("db_pool_saturation", "Checked out / (pool_size + max_overflow)", "gauge", _pool("saturation"))
+cache_hits = Collected("cache_hits_total", "In-process cache hits", "counter", _caches("hits"), ["cache"])
+cache_misses = Collected("cache_misses_total", "In-process cache misses", "counter", _caches("misses"), ["cache"])
+cache_evictions = Collected("cache_evictions_total", "In-process cache LRU evictions", "counter", _caches("evictions"), ["cache"])
+cache_entries = Collected("cache_entries", "In-process cache size", "gauge", _caches("size"), ["cache"])
+
+REGISTRY = [
+    http_requests, http_latency, http_in_flight, http_db_queries, http_db_seconds, db_query_latency, import_stage_latency,
+    db_pool_checkouts, db_pool_wait, db_pool_wait_max, db_pool_timeouts, db_pool_checked_out, db_pool_saturation,
+    cache_hits, cache_misses, cache_evictions, cache_entries,
+]
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+@dataclass
+class QueryStats:
+    count: int = 0
+    seconds: float = 0.0
+    statements: Dict[str, list] = field(default_factory=dict)  # SQL -> [count, seconds]
+
+    def observe(self, statement: str, seconds: float) -> None:
+        self.count += 1
+        self.seconds += seconds
+        entry = self.statements.get(statement)
+        if entry is None:
+            if len(self.statements) >= BREAKDOWN_MAX_STATEMENTS:
+                return
+            entry = self.statements[statement] = [0, 0.0]
+        entry[0] += 1
+        entry[1] += seconds
+
+    def breakdown(self, top: int = 5) -> list:
+        worst = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)[:top]
+        return [
+            {"sql": " ".join(sql.split())[:200], "count": count, "ms": round(seconds * 1000, 1)}
+            for sql, (count, seconds) in worst
+        ]
+
+
+current_queries: ContextVar[Optional[QueryStats]] = ContextVar("current_queries", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    elapsed = time.perf_counter() - started
+    db_query_latency.observe(elapsed)
+    stats = current_queries.get()
+    if stats is not None:
+        stats.observe(statement, elapsed)
+
+
+def instrument_engine(engine: Engine) -> None:
+    # Для AsyncEngine передавать engine.sync_engine
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def observe_import_stage(stage: str, seconds: float) -> None:
+    import_stage_latency.observe(seconds, stage)
+
+
+def route_template(request) -> str:
+    """Шаблон маршрута ("/api/v1/products/{sku}"), а не сам путь - иначе метка на каждый SKU."""
+    route = request.scope.get("route")
+    regex = getattr(route, "path_regex", None)
+    if regex is None:
+        return "unmatched"
+    # Маршрут из include_router может знать путь без префикса роутера - префикс берем из URL
+    path = request.url.path
+    for i, char in enumerate(path):
+        if char == "/" and regex.fullmatch(path[i:]):
+            return path[:i] + route.path
+    return route.path
+
+
+async def metrics_middleware(request, call_next):
+    """Задержка по маршруту (шаблон пути, а не сам путь), запросы в работе, запросы к БД."""
+    stats = QueryStats()
+    token = current_queries.set(stats)
+    http_in_flight.inc()
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - started
+        http_in_flight.dec()
+        current_queries.reset(token)
+
+        path = route_template(request)
+        method = request.method
+        http_requests.inc(method, path, status_code)
+        http_latency.observe(elapsed, method, path)
+        http_db_queries.observe(stats.count, method, path)
+        http_db_seconds.observe(stats.seconds, method, path)
+
+        if elapsed * 1000 >= settings.SLOW_REQUEST_MS:
+            logger.warning(
+                "slow request %s %s status=%s %.1fms db_queries=%s db_ms=%.1f top=%s",
+                method, request.url.path, status_code, elapsed * 1000,
+                stats.count, stats.seconds * 1000, stats.breakdown(),
+            )
@@ -1,12 +1,22 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import jwt
 from passlib.context import CryptContext
 from app.config import settings
+from app.services.cache import TTLCache
 
 # Настройка хеширования (bcrypt)
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt считает 100-300 мс и держит CPU: гоняем его в отдельных потоках, а не в event loop
+_hash_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    thread_name_prefix="bcrypt",
+)
+
 # Настройка JWT
 ALGORITHM = "HS256"
 
@@ -26,3 +36,43 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, get_password_hash, password)
+
+
+class LoginRateLimiter:
+    """Не больше max_attempts попыток входа на аккаунт за окно window_seconds.
+
+    Считаем все попытки (не только неудачные): каждая стоит bcrypt. Счетчики лежат
+    в TTLCache, так что перебор по случайным email не раздует память.
+    """
+
+    def __init__(self, max_attempts: int, window_seconds: int, maxsize: int = 100_000):
+        self.max_attempts = max_attempts
+        self.window_seconds = window_seconds
+        self._windows = TTLCache(maxsize=maxsize, ttl=window_seconds)
+
+    def hit(self, key: str) -> Optional[int]:
+        """Засчитывает попытку. None - можно, иначе через сколько секунд пробовать снова."""
+        key = key.strip().lower()
+        now = time.monotonic()
+        window_end, attempts = self._windows.get(key, (now + self.window_seconds, 0))
+        if attempts >= self.max_attempts:
+            return max(1, int(window_end - now))
+        self._windows.set(key, (window_end, attempts + 1), ttl=window_end - now)
+        return None
+
+    def reset(self, key: str) -> None:
+        self._windows.delete(key.strip().lower())
+
+
+login_rate_limiter = LoginRateLimiter(
+    max_attempts=settings.LOGIN_MAX_ATTEMPTS,
+    window_seconds=settings.LOGIN_WINDOW_SECONDS,
+)
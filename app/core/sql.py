@@ -0,0 +1,105 @@
+"""Несколько SQL-конструкций, которые по-разному пишутся в Postgres и SQLite.
+
+Основная база - Postgres; SQLite нужен для локальных прогонов и бенчмарков (benchmarks/).
+"""
+from sqlalchemy import Date, DateTime, PrimaryKeyConstraint, Values, cast, type_coerce
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.base import Executable
+from sqlalchemy.sql.elements import ClauseElement
+from sqlalchemy.sql.functions import FunctionElement
+
+
+class day_start(FunctionElement):
+    """Начало дня (timestamp): date_trunc('day', x) в Postgres."""
+    type = DateTime()
+    name = "day_start"
+    inherit_cache = True
+
+
+class day_of(FunctionElement):
+    """Дата без времени: CAST(x AS DATE) в Postgres."""
+    type = Date()
+    name = "day_of"
+    inherit_cache = True
+
+
+@compiles(day_start)
+def _day_start(element, compiler, **kw):
+    # 'day' литералом, а не параметром: иначе GROUP BY и SELECT получат разные $1/$2 в asyncpg
+    return "date_trunc('day', %s)" % compiler.process(element.clauses, **kw)
+
+
+@compiles(day_start, "sqlite")
+def _day_start_sqlite(element, compiler, **kw):
+    return "datetime(date(%s))" % compiler.process(element.clauses, **kw)
+
+
+@compiles(day_of)
+def _day_of(element, compiler, **kw):
+    return "CAST(%s AS DATE)" % compiler.process(element.clauses, **kw)
+
+
+@compiles(day_of, "sqlite")
+def _day_of_sqlite(element, compiler, **kw):
+    # CAST(... AS DATE) в SQLite дает число (год), а не дату
+    return "date(%s)" % compiler.process(element.clauses, **kw)
+
+
+class explain(Executable, ClauseElement):
+    """EXPLAIN (options) над запросом SQLAlchemy (Postgres). Параметры запроса остаются параметрами,
+    а не вклеиваются в текст: ввод пользователя не разбирается как SQL и как :имя параметра."""
+    inherit_cache = False
+
+    def __init__(self, statement, options: str = "FORMAT JSON"):
+        self.statement = statement
+        self.options = options
+
+
+@compiles(explain)
+def _explain(element, compiler, **kw):
+    return "EXPLAIN (%s) %s" % (element.options, compiler.process(element.statement, **kw))
+
+
+def dialect_insert(dialect_name: str):
+    """insert() с on_conflict_do_nothing для текущей базы."""
+    return sqlite.insert if dialect_name == "sqlite" else postgresql.insert
+
+
+def values_cast(dialect_name: str):
+    """Приведение колонок VALUES к типу. Postgres без CAST считает параметры VALUES текстом,
+    а в SQLite CAST(... AS DATETIME) превращает дату в число - там тип только для SQLAlchemy."""
+    return type_coerce if dialect_name == "sqlite" else cast
+
+
+@compiles(Values, "sqlite")
+def _values_sqlite(element, compiler, asfrom=False, from_linter=None, **kw):
+    # SQLite не понимает имена колонок у (VALUES ...) AS v (a, b) - называем их через подзапрос:
+    # (SELECT column1 AS a, column2 AS b FROM (VALUES ...)) AS v. Так работает UPDATE ... FROM VALUES
+    if not asfrom or element._unnamed:
+        return compiler.visit_values(element, asfrom=asfrom, from_linter=from_linter, **kw)
+    kw.pop("visiting_cte", None)
+    if from_linter:
+        from_linter.froms[element._de_clone()] = element.name
+    quote = compiler.preparer.quote
+    columns = ", ".join(f"column{n} AS {quote(c.name)}" for n, c in enumerate(element.columns, 1))
+    return "(SELECT %s FROM (%s)) AS %s" % (columns, compiler._render_values(element, **kw), quote(element.name))
+
+
+def partitioned_by_range(column: str) -> dict:
+    """__table_args__ для таблицы, секционированной по диапазонам column (только Postgres).
+
+    В Postgres первичный ключ секционированной таблицы обязан включать ключ секционирования -
+    его добавляет компиляция PRIMARY KEY ниже. В модели (и в SQLite) ключ остается одним id.
+    """
+    return {"postgresql_partition_by": f"RANGE ({column})", "info": {"partition_key": column}}
+
+
+@compiles(PrimaryKeyConstraint, "postgresql")
+def _partitioned_primary_key(constraint, compiler, **kw):
+    sql = compiler.visit_primary_key_constraint(constraint, **kw)
+    table = constraint.table
+    key = table.info.get("partition_key") if table is not None else None
+    if key and key not in constraint.columns.keys():
+        sql = sql.replace(")", ", %s)" % compiler.preparer.quote(key), 1)
+    return sql
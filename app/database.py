@@ -1,9 +1,68 @@
+import time
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from app.config import settings  # <--- Теперь берем настройки отсюда
 
+
+class PoolStats:
+    """Сколько ждем соединение из пула и сколько раз не дождались."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+
+    def observe(self, wait: float) -> None:
+        self.checkouts += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+
+
+pool_stats = PoolStats()
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    # Замеряем время выдачи соединения: если пул забит, это видно в /health/db
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            pool_stats.timeouts += 1
+            raise
+        finally:
+            pool_stats.observe(time.perf_counter() - started)
+
+
+def _engine_options(database_url: str) -> dict:
+    options = {"echo": settings.DB_ECHO}
+    url = make_url(database_url)
+    if url.get_backend_name() == "sqlite":
+        # Для SQLite (локальные прогоны/бенчмарки) настройки пула не нужны
+        return options
+
+    options.update(
+        poolclass=TimedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
+    if url.get_driver_name() == "asyncpg":
+        options["connect_args"] = {
+            "server_settings": {"statement_timeout": str(settings.DB_STATEMENT_TIMEOUT_MS)},
+            "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+        }
+    return options
+
+
 # Создаем движок
-engine = create_async_engine(settings.DATABASE_URL, echo=True)
+engine = create_async_engine(settings.DATABASE_URL, **_engine_options(settings.DATABASE_URL))
 
 # Фабрика сессий
 AsyncSessionLocal = async_sessionmaker(
@@ -17,4 +76,23 @@ class Base(DeclarativeBase):
 
 async def get_db():
     async with AsyncSessionLocal() as session:
-        yield session
\ No newline at end of file
+        yield session
+
+
+def pool_status() -> dict:
+    pool = engine.sync_engine.pool
+    status = {
+        "checkouts": pool_stats.checkouts,
+        "checkout_wait_avg_ms": round(pool_stats.wait_total / pool_stats.checkouts * 1000, 3) if pool_stats.checkouts else 0.0,
+        "checkout_wait_max_ms": round(pool_stats.wait_max * 1000, 3),
+        "checkout_timeouts": pool_stats.timeouts,
+    }
+    if isinstance(pool, TimedQueuePool):
+        capacity = pool.size() + settings.DB_MAX_OVERFLOW
+        status.update(
+            pool_size=pool.size(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+            saturation=round(pool.checkedout() / capacity, 3) if capacity else 0.0,
+        )
+    return status
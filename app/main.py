@@ -1,9 +1,40 @@
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware # <--- ИМПОРТ 1
 from app.config import settings
+from app.core import metrics
+from app.database import engine, pool_status
 from app.routers import auth, analytics, products
+from app.services.cache import dashboard_cache
+from app.services.downloader import close_client
+from app.services.partitions import ensure_future
+from app.services.scheduler import sync_scheduler
+from app.services.sync_jobs import sync_jobs
 
-app = FastAPI(title=settings.PROJECT_NAME)
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Секции orders на текущий и следующие месяцы (на SQLite - ничего)
+    try:
+        await ensure_future(engine)
+    except Exception:
+        logger.exception("could not create orders partitions")
+    if settings.AUTO_SYNC_ENABLED:
+        sync_scheduler.start()
+    yield
+    # Останавливаем планировщик и фоновые импорты вместе с приложением
+    await sync_scheduler.stop()
+    await sync_jobs.shutdown()
+    await close_client()
+
+app = FastAPI(title=settings.PROJECT_NAME, lifespan=lifespan)
+
+# Задержки по маршрутам, запросы в работе, число и время запросов к БД на HTTP-запрос
+metrics.instrument_engine(engine.sync_engine)
+app.middleware("http")(metrics.metrics_middleware)
 
 # --- НАСТРОЙКА CORS (НОВОЕ) ---
 # Это разрешает запросы с любого сайта (для разработки удобно)
@@ -13,6 +44,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count"],  # Пагинация товаров
 )
 # ------------------------------
 
@@ -22,4 +54,19 @@ app.include_router(products.router, prefix="/api/v1/products")
 
 @app.get("/")
 def read_root():
-    return {"Status": "Active", "Version": "1.0.0"}
\ No newline at end of file
+    return {"Status": "Active", "Version": "1.0.0"}
+
+# Счетчики кэша дашборда (hit / miss / eviction)
+@app.get("/health/cache")
+async def cache_stats():
+    return {"dashboard": await dashboard_cache.stats()}
+
+# Пул соединений: ожидание выдачи и загрузка
+@app.get("/health/db")
+def db_pool_stats():
+    return pool_status()
+
+# Метрики в формате Prometheus
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -1,6 +1,8 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Boolean
+from sqlalchemy import DDL, event
+from sqlalchemy import Column, Computed, Integer, BigInteger, String, Float, ForeignKey, DateTime, Date, Boolean, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
+from .core.sql import partitioned_by_range
 from .database import Base
 
 class User(Base):
@@ -25,11 +27,30 @@ class CompanySettings(Base):
 
     owner = relationship("User", back_populates="settings")
 
+# Формулы генерируемых колонок products (в миграции - те же)
+UNIT_COST_SQL = (
+    "coalesce(purchase_price, 0) + coalesce(logistics_china, 0) + coalesce(logistics_inner, 0)"
+    " + coalesce(packaging_cost, 0) + coalesce(other_expenses, 0)"
+)
+HAS_COSTS_SQL = "coalesce(purchase_price, 0) <> 0"
+
 class Product(Base):
     __tablename__ = "products"
+    __table_args__ = (
+        # Один SKU на пользователя: по нему ищет импорт и join с заказами
+        UniqueConstraint("user_id", "sku", name="uq_products_user_id_sku"),
+        # Постраничный список: WHERE user_id = ? AND id > ? ORDER BY id
+        Index("ix_products_user_id_id", "user_id", "id"),
+        # Фильтр по началу SKU (LIKE 'abc%') при любой collation
+        Index("ix_products_user_id_sku_prefix", "user_id", "sku", postgresql_ops={"sku": "text_pattern_ops"}),
+        # Поиск по подстроке названия (ILIKE '%abc%') - триграммы
+        Index("ix_products_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+        # Счетчик "товары без себестоимости" и фильтр missing_costs - по индексу
+        Index("ix_products_user_id_has_costs", "user_id", "has_costs"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
-    sku = Column(String, index=True)
+    sku = Column(String)
     name = Column(String)
     
     # --- ВОТ ЭТИ ПОЛЯ ТЕРЯЛИСЬ ---
@@ -41,23 +62,70 @@ class Product(Base):
     kaspi_commission = Column(Float, default=0.0)  # Комиссия
     # -----------------------------
 
+    # Считает сама база при каждой записи (PATCH, массовое обновление, импорт) - в аналитике не складываем
+    unit_cost = Column(Float, Computed(UNIT_COST_SQL, persisted=True))  # Расходы на одну штуку
+    has_costs = Column(Boolean, Computed(HAS_COSTS_SQL, persisted=True))  # Закуп заполнен
+
     owner = relationship("User", back_populates="products")
 
 class Order(Base):
     __tablename__ = "orders"
+    __table_args__ = (
+        # Дашборд и итоги: WHERE user_id = ? AND order_date >= ?
+        Index("ix_orders_user_id_order_date", "user_id", "order_date"),
+        # Пересчет дней по товару
+        Index("ix_orders_user_id_sku", "user_id", "sku"),
+        # В секционированной таблице уникальный ключ обязан включать order_date.
+        # Дубль того же заказа с другой датой отсекает импорт (сверка по kaspi_id до вставки)
+        UniqueConstraint("user_id", "kaspi_id", "order_date", name="uq_orders_user_id_kaspi_id_order_date"),
+        # Postgres: секция на месяц (app/services/partitions.py), дашборд читает только нужные
+        partitioned_by_range("order_date"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     
-    kaspi_id = Column(String, index=True)
-    sku = Column(String, index=True)
+    kaspi_id = Column(String)
+    sku = Column(String)
     product_name = Column(String)
     amount = Column(Float)
     status = Column(String)
-    order_date = Column(DateTime)
+    order_date = Column(DateTime, nullable=False)  # Ключ секционирования
     
     # Поле количества
     quantity = Column(Integer, default=1) 
 
     delivery_cost_for_seller = Column(Float, default=0.0)
 
-    owner = relationship("User", back_populates="orders") # Комиссия
\ No newline at end of file
+    # Отпечаток полей строки выгрузки: при повторном синке неизмененные строки пропускаем
+    row_hash = Column(BigInteger, nullable=True)
+
+    owner = relationship("User", back_populates="orders") # Комиссия
+
+# Секция для дат, под которые еще нет помесячной секции (create_all; в базе - миграцией)
+event.listen(
+    Order.__table__,
+    "after_create",
+    DDL("CREATE TABLE IF NOT EXISTS orders_default PARTITION OF orders DEFAULT").execute_if(dialect="postgresql"),
+)
+
+# Готовые итоги по дням (чтобы дашборд не пересчитывал всю историю заказов)
+class DailyStat(Base):
+    __tablename__ = "daily_stats"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+
+    revenue = Column(Float, default=0.0)
+    profit = Column(Float, default=0.0)
+    orders_count = Column(Integer, default=0)
+    without_costs = Column(Integer, default=0)  # Заказы без себестоимости
+
+# Состояние синхронизации пользователя: до какой даты заказов уже дошли
+class SyncState(Base):
+    __tablename__ = "sync_states"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    source_url = Column(String, nullable=True)         # Для какой таблицы отметки ниже
+    last_order_date = Column(DateTime, nullable=True)  # Самый поздний заказ из выгрузки
+    last_synced_at = Column(DateTime, nullable=True)
+    # Валидаторы прошлого ответа - для условного запроса (304 Not Modified)
+    etag = Column(String, nullable=True)
+    last_modified = Column(String, nullable=True)
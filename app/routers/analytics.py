@@ -1,142 +1,251 @@
-from fastapi import APIRouter, Depends
+import heapq
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from datetime import datetime, timedelta
 from pydantic import BaseModel
-from typing import List # <--- Вот этого не хватало в прошлый раз
+from typing import List, Optional # <--- Вот этого не хватало в прошлый раз
 
 from app.database import get_db
-from app.models import Order, Product, CompanySettings
-from app.schemas import DashboardStats, DailyStats
-from app.routers.auth import get_current_user
-from app.services.importer import sync_kaspi_data
+from app.models import CompanySettings
+from app.schemas import (
+    DashboardStats, DashboardWindows, SyncJobOut, CompanySettingsOut, CompanySettingsUpdate, WhatIfRequest,
+    ProductReport, ProductReportRow, WindowStats,
+)
+from app.routers.auth import get_current_user_id
+from app.services.cache import dashboard_cache
+from app.services.columnar import columnar_store, compute
+from app.services.export import export_orders_csv
+from app.services.rollups import dashboard_rows_query, period_totals_query, rebuild_user
+from app.services.stats import (
+    build_dashboard, get_tax_percent, period_delta, period_totals, products_without_costs_query,
+    sku_report_query, DEFAULT_TAX_PERCENT,
+)
+from app.services.sync_jobs import sync_jobs, SyncJob
 
 router = APIRouter(tags=["Analytics"])
 
 class SyncRequest(BaseModel):
     csv_url: str
 
-@router.post("/sync")
+def _job_out(job: SyncJob) -> SyncJobOut:
+    return SyncJobOut(
+        job_id=job.id,
+        status=job.status,
+        created_at=job.created_at,
+        rows_read=job.rows_read,
+        imported=job.imported,
+        changed=job.changed,
+        unchanged=job.unchanged,
+        skipped=job.skipped,
+        elapsed_sec=job.elapsed_sec,
+        error=job.error,
+        result=job.result,
+    )
+
+# Импорт идет в фоне: сразу отдаем id задачи, прогресс - через GET /sync/{job_id}
+@router.post("/sync", response_model=SyncJobOut, status_code=status.HTTP_202_ACCEPTED)
 async def sync_data(
     request: SyncRequest,
-    db: AsyncSession = Depends(get_db),
-    current_user = Depends(get_current_user)
+    user_id: int = Depends(get_current_user_id)
 ):
-    return await sync_kaspi_data(request.csv_url, current_user.id, db)
+    job = sync_jobs.submit(user_id, request.csv_url)
+    return _job_out(job)
+
+@router.get("/sync/{job_id}", response_model=SyncJobOut)
+async def get_sync_status(
+    job_id: str,
+    user_id: int = Depends(get_current_user_id)
+):
+    job = sync_jobs.get(job_id)
+    if not job or job.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Sync job not found")
+    return _job_out(job)
 
 @router.get("/dashboard", response_model=DashboardStats)
 async def get_dashboard_stats(
     days: int = 30,
     db: AsyncSession = Depends(get_db),
-    current_user = Depends(get_current_user)
+    user_id: int = Depends(get_current_user_id)
+):
+    cached = await dashboard_cache.get(user_id, days)
+    if cached is not None:
+        return cached
+
+    # Готовые итоги по дням: не больше `days` строк, заказы не трогаем.
+    # Налог уже учтен в прибыли при пересчете итогов.
+    start_day = (datetime.now() - timedelta(days=days)).date()
+    result = await db.execute(dashboard_rows_query(user_id, start_day))
+    rows = result.scalars().all()
+    without_costs = await db.scalar(products_without_costs_query(user_id))
+    stats = build_dashboard(rows, without_costs)
+
+    await dashboard_cache.set(user_id, days, stats)
+    return stats
+
+# Сколько окон можно запросить за раз
+MAX_WINDOWS = 8
+
+# Несколько окон (7/30/90 дней) и сравнение с прошлым периодом - одним запросом к итогам по дням
+@router.get("/dashboard/windows", response_model=DashboardWindows)
+async def get_dashboard_windows(
+    days: List[int] = Query([7, 30, 90]),
+    compare: bool = True,           # Добавить такой же период перед каждым окном и разницу
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id)
 ):
-    # 1. Получаем настройки (налог)
-    res_settings = await db.execute(select(CompanySettings).where(CompanySettings.user_id == current_user.id))
-    settings = res_settings.scalar_one_or_none()
-    tax_percent = settings.tax_percent if settings else 3.0 
-
-    # 2. Период
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=days)
-
-    # 3. Загружаем заказы
-    query = (
-        select(Order, Product)
-        .join(Product, Order.sku == Product.sku, isouter=True)
-        .where(
-            Order.user_id == current_user.id,
-            Order.order_date >= start_date
-        )
+    windows = sorted(set(days))
+    if not 1 <= len(windows) <= MAX_WINDOWS or windows[0] < 1:
+        raise HTTPException(status_code=400, detail=f"Нужно от 1 до {MAX_WINDOWS} окон, каждое >= 1 дня")
+
+    cache_key = f"windows:{','.join(map(str, windows))}:{int(compare)}"
+    cached = await dashboard_cache.get(user_id, cache_key, DashboardWindows)
+    if cached is not None:
+        return cached
+
+    # Границы те же, что у /dashboard: окно N дней - с (сегодня - N) по сегодня, то есть N+1 день.
+    # Прошлый период - столько же дней прямо перед ним
+    today = datetime.now().date()
+    periods = {}
+    for n in windows:
+        start = today - timedelta(days=n)
+        periods[f"cur{n}"] = (start, None)
+        if compare:
+            periods[f"prev{n}"] = (start - timedelta(days=n + 1), start)
+
+    # Одна строка: суммы по всем периодам + счетчик товаров без себестоимости
+    query = period_totals_query(user_id, periods).add_columns(
+        products_without_costs_query(user_id).scalar_subquery().label("products_without_costs")
+    )
+    row = (await db.execute(query)).one()._mapping
+
+    def totals(name: str, start, end):
+        return period_totals(start, end, row[f"{name}_revenue"], row[f"{name}_profit"], row[f"{name}_orders"])
+
+    items = []
+    for n in windows:
+        start = periods[f"cur{n}"][0]
+        item = WindowStats(days=n, current=totals(f"cur{n}", start, today))
+        if compare:
+            prev_start, prev_end = periods[f"prev{n}"]
+            item.previous = totals(f"prev{n}", prev_start, prev_end - timedelta(days=1))
+            item.delta = period_delta(item.current, item.previous)
+        items.append(item)
+
+    stats = DashboardWindows(windows=items, products_without_costs=row["products_without_costs"] or 0)
+    await dashboard_cache.set(user_id, cache_key, stats)
+    return stats
+
+# Метрики, по которым можно сортировать отчет по товарам
+REPORT_METRICS = ("units", "revenue", "cogs", "commission", "tax", "delivery", "profit", "margin_percent", "roi_percent")
+
+def _report_row(row) -> ProductReportRow:
+    revenue = row.revenue or 0.0
+    profit = row.profit or 0.0
+    expenses = revenue - profit
+    return ProductReportRow(
+        sku=row.sku or "",
+        name=row.name,
+        orders_count=row.orders_count,
+        units=row.units or 0,
+        revenue=round(revenue, 2),
+        cogs=round(row.cogs or 0.0, 2),
+        commission=round(row.commission or 0.0, 2),
+        tax=round(row.tax or 0.0, 2),
+        delivery=round(row.delivery or 0.0, 2),
+        profit=round(profit, 2),
+        margin_percent=round(profit / revenue * 100, 2) if revenue > 0 else 0,
+        roi_percent=round(profit / expenses * 100, 2) if expenses > 0 else 0,
     )
-    result = await db.execute(query)
-    rows = result.all()
-
-    # 4. Переменные
-    total_revenue = 0.0
-    total_profit = 0.0
-    total_orders = 0
-    products_without_costs = 0
-    daily_map = {} 
-
-    # 5. СЧИТАЕМ
-    for order, product in rows:
-        if order.status in ["Отменен", "Возврат"]:
-            continue
-
-        total_orders += 1
-        revenue = order.amount
-        total_revenue += revenue
-        
-        # Количество в заказе
-        qty = order.quantity if order.quantity and order.quantity > 0 else 1
-
-        total_cogs = 0.0 # Себестоимость товаров
-        
-        if product:
-            # Расходы на ОДНУ штуку
-            purchase = product.purchase_price or 0
-            log_china = product.logistics_china or 0
-            log_inner = product.logistics_inner or 0
-            pack = product.packaging_cost or 0
-            
-            # Умножаем на количество (Закуп * кол-во + Логистика * кол-во...)
-            unit_cost = purchase + log_china + log_inner + pack
-            total_cogs = unit_cost * qty
-
-            # Комиссия Каспи (% от Цены Продажи)
-            comm_percent = product.kaspi_commission or 0
-            commission_amount = revenue * (comm_percent / 100)
-            
-            # Добавляем комиссию к расходам (или можно вычесть отдельно, математика одна)
-            total_cogs += commission_amount
-
-            if purchase == 0:
-                products_without_costs += 1
-        else:
-            products_without_costs += 1
-
-        # Налог (% от Цены Продажи)
-        tax_amount = revenue * (tax_percent / 100)
-        
-        # Доставка Каспи (берем из заказа)
-        delivery_kaspi = order.delivery_cost_for_seller or 0
-
-        # ФОРМУЛА: Прибыль = Выручка - (Себестоимость*Кол-во + Комиссия) - Налог - ДоставкаКаспи
-        profit = revenue - total_cogs - tax_amount - delivery_kaspi
-        
-        total_profit += profit
-
-        # Группировка по дням
-        day_key = order.order_date.date()
-        if day_key not in daily_map:
-            daily_map[day_key] = {"revenue": 0.0, "profit": 0.0, "count": 0}
-        
-        daily_map[day_key]["revenue"] += revenue
-        daily_map[day_key]["profit"] += profit
-        daily_map[day_key]["count"] += 1
-
-    # 6. Итоги
-    margin = (total_profit / total_revenue * 100) if total_revenue > 0 else 0
-    total_expenses = total_revenue - total_profit
-    roi = (total_profit / total_expenses * 100) if total_expenses > 0 else 0
-
-    # 7. График
-    chart_data = []
-    for day in sorted(daily_map.keys()):
-        stats = daily_map[day]
-        chart_data.append(DailyStats(
-            date=day,
-            revenue=round(stats["revenue"], 2),
-            profit=round(stats["profit"], 2),
-            orders_count=stats["count"]
-        ))
-
-    return DashboardStats(
-        total_revenue=round(total_revenue, 2),
-        total_profit=round(total_profit, 2),
-        total_orders=total_orders,
-        margin_percent=round(margin, 2),
-        roi_percent=round(roi, 2),
-        chart_data=chart_data,
-        products_without_costs=products_without_costs
-    )
\ No newline at end of file
+
+@router.get("/products", response_model=ProductReport)
+async def get_products_report(
+    days: int = 30,
+    sort_by: str = Query("profit", pattern="^(" + "|".join(REPORT_METRICS) + ")$"),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    limit: int = Query(50, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id)
+):
+    tax_percent = await get_tax_percent(db, user_id)
+    start_date = datetime.now() - timedelta(days=days)
+
+    # База группирует по SKU (строк не больше, чем товаров), здесь - только top-N через кучу
+    result = await db.execute(sku_report_query(user_id, tax_percent, start_date))
+    rows = [_report_row(row) for row in result.all()]
+    pick = heapq.nlargest if order == "desc" else heapq.nsmallest
+    top = pick(limit, rows, key=lambda r: getattr(r, sort_by))
+
+    return ProductReport(total_skus=len(rows), sort_by=sort_by, items=top)
+
+# Выгрузка заказов с прибылью: CSV потоком, память не растет с числом строк
+@router.get("/export")
+async def export_orders(
+    days: Optional[int] = None,      # Не задано - вся история
+    gzip: bool = False,
+    user_id: int = Depends(get_current_user_id)
+):
+    start_date = datetime.now() - timedelta(days=days) if days else None
+    filename = "orders.csv.gz" if gzip else "orders.csv"
+    return StreamingResponse(
+        export_orders_csv(user_id, start_date, gzip=gzip),
+        media_type="application/gzip" if gzip else "text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@router.post("/what-if", response_model=DashboardStats)
+async def what_if(
+    request: WhatIfRequest,
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id)
+):
+    # Первый вызов грузит историю в память, дальше - только расчет по массивам
+    tenant = await columnar_store.get(db, user_id)
+    start = request.start_date or (datetime.now() - timedelta(days=request.days)).date()
+    return compute(
+        tenant,
+        start=start,
+        end=request.end_date,
+        skus=request.skus,
+        commission_percent=request.commission_percent,
+        tax_percent=request.tax_percent,
+    )
+
+@router.get("/settings", response_model=CompanySettingsOut)
+async def get_company_settings(
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id)
+):
+    result = await db.execute(select(CompanySettings).where(CompanySettings.user_id == user_id))
+    company = result.scalar_one_or_none()
+    if not company:
+        return CompanySettingsOut(tax_percent=DEFAULT_TAX_PERCENT)
+    return company
+
+@router.patch("/settings", response_model=CompanySettingsOut)
+async def update_company_settings(
+    settings_update: CompanySettingsUpdate,
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id)
+):
+    result = await db.execute(select(CompanySettings).where(CompanySettings.user_id == user_id))
+    company = result.scalar_one_or_none()
+    if not company:
+        company = CompanySettings(user_id=user_id, tax_percent=DEFAULT_TAX_PERCENT)
+        db.add(company)
+
+    old_tax = company.tax_percent
+    for key, value in settings_update.dict(exclude_unset=True).items():
+        setattr(company, key, value)
+
+    # Налог зашит в прибыль итогов по дням - при его смене пересчитываем всю историю
+    await db.flush()
+    if company.tax_percent != old_tax:
+        await rebuild_user(db, user_id)
+
+    await db.commit()
+    await db.refresh(company)
+    await dashboard_cache.invalidate(user_id)
+    columnar_store.mark_costs_stale(user_id)
+    return company
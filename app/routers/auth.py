@@ -1,6 +1,8 @@
+from dataclasses import dataclass
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import event, inspect
 from sqlalchemy.future import select
 from jose import jwt, JWTError
 from datetime import timedelta
@@ -8,35 +10,87 @@ from datetime import timedelta
 from app.database import get_db
 from app.models import User
 from app.schemas import UserCreate, UserOut, Token
-from app.core.security import get_password_hash, verify_password, create_access_token
+from app.core.security import (
+    get_password_hash_async, verify_password_async, create_access_token, login_rate_limiter,
+)
 from app.config import settings
+from app.services.cache import TTLCache
 
 router = APIRouter(tags=["Authentication"])
 
 # Указываем FastAPI, где брать токен (URL логина)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/token")
 
-# --- ВОТ ЭТОЙ ФУНКЦИИ НЕ ХВАТАЛО ---
-async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+# Кто делает запрос. Кэшируем по email из токена, чтобы не ходить в users на каждый запрос
+@dataclass(frozen=True)
+class CurrentUser:
+    id: int
+    email: str
+    is_active: bool
+
+_user_cache = TTLCache(maxsize=settings.AUTH_CACHE_MAX_ENTRIES, ttl=settings.AUTH_CACHE_TTL_SECONDS, name="auth_users")
+
+def invalidate_user_cache(email: str) -> None:
+    _user_cache.delete(email)
+
+# Пользователя изменили или удалили (например, is_active=False) - применяем сразу, не ждем TTL.
+# Только в этом процессе: другие воркеры узнают через AUTH_CACHE_TTL_SECONDS
+@event.listens_for(User, "after_update")
+def _update_cached_user(mapper, connection, target):
+    for email in set(inspect(target).attrs.email.history.sum()) | {target.email}:
+        if email:
+            invalidate_user_cache(email)
+    _user_cache.set(target.email, CurrentUser(id=target.id, email=target.email, is_active=target.is_active is not False))
+
+@event.listens_for(User, "after_delete")
+def _drop_cached_user(mapper, connection, target):
+    for email in set(inspect(target).attrs.email.history.sum()) | {target.email}:
+        if email:
+            invalidate_user_cache(email)
+
+credentials_exception = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Could not validate credentials",
+    headers={"WWW-Authenticate": "Bearer"},
+)
+inactive_exception = HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Inactive user")
+
+def _decode_token(token: str) -> dict:
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
     except JWTError:
         raise credentials_exception
-    
-    result = await db.execute(select(User).where(User.email == email))
-    user = result.scalar_one_or_none()
-    
-    if user is None:
+    if payload.get("sub") is None:
         raise credentials_exception
+    return payload
+
+async def _load_user(email: str, db: AsyncSession) -> CurrentUser:
+    user = _user_cache.get(email)
+    if user is None:
+        result = await db.execute(select(User.id, User.email, User.is_active).where(User.email == email))
+        row = result.one_or_none()
+        if row is None:
+            raise credentials_exception
+        user = CurrentUser(id=row.id, email=row.email, is_active=row.is_active is not False)
+        _user_cache.set(email, user)
+    if not user.is_active:
+        raise inactive_exception
     return user
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> CurrentUser:
+    payload = _decode_token(token)
+    return await _load_user(payload["sub"], db)
+
+async def get_current_user_id(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> int:
+    """Только id пользователя. Пользователь - из кэша, при промахе из users: отключенного или
+    удаленного (в том числе другим воркером) отсекаем не позже чем через AUTH_CACHE_TTL_SECONDS."""
+    payload = _decode_token(token)
+    user = await _load_user(payload["sub"], db)
+    # email мог достаться другому пользователю - токен выдан не ему
+    uid = payload.get("uid")
+    if uid is not None and uid != user.id:
+        raise credentials_exception
+    return user.id
 # -----------------------------------
 
 @router.post("/register", response_model=UserOut)
@@ -46,8 +100,10 @@ async def register(user_in: UserCreate, db: AsyncSession = Depends(get_db)):
     
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    
-    hashed_pw = get_password_hash(user_in.password)
+
+    # Соединение возвращаем в пул на время bcrypt: иначе шторм регистраций/логинов займет весь пул
+    await db.close()
+    hashed_pw = await get_password_hash_async(user_in.password)
     new_user = User(email=user_in.email, hashed_password=hashed_pw)
     
     db.add(new_user)
@@ -61,19 +117,32 @@ async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(), 
     db: AsyncSession = Depends(get_db)
 ):
-    result = await db.execute(select(User).where(User.email == form_data.username))
-    user = result.scalar_one_or_none()
-    
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    retry_after = login_rate_limiter.hit(form_data.username)
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+    result = await db.execute(
+        select(User.id, User.email, User.hashed_password).where(User.email == form_data.username)
+    )
+    user = result.one_or_none()
+    # Соединение возвращаем в пул на время bcrypt: иначе шторм логинов займет весь пул
+    await db.close()
+
+    if not user or not await verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    login_rate_limiter.reset(form_data.username)
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
+        data={"sub": user.email, "uid": user.id}, expires_delta=access_token_expires
     )
     
     return {"access_token": access_token, "token_type": "bearer"}
\ No newline at end of file
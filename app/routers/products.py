@@ -1,45 +1,123 @@
-from fastapi import APIRouter, Depends, HTTPException
+import time
+import pandas as pd
+from fastapi import APIRouter, Body, Depends, File, HTTPException, Query, Response, UploadFile
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from typing import List
+from typing import List, Optional
 
 from app.database import get_db
-from app.models import Product, User
-from app.schemas import ProductOut, ProductUpdate
-from app.routers.auth import get_current_user # Защищаем роуты!
+from app.models import Product
+from app.schemas import ProductOut, ProductUpdate, ProductBulkResponse, ProductBulkResult
+from app.routers.auth import get_current_user_id # Защищаем роуты!
+from app.services.cache import dashboard_cache
+from app.services.columnar import columnar_store
+from app.services.pagination import decode_cursor, encode_cursor, estimated_count, exact_count
+from app.services.product_costs import apply_cost_updates, parse_costs_csv, validate_items
+from app.services.rollups import refresh_sku_days
 
 router = APIRouter(tags=["Products"])
 
-# 1. Получить список всех товаров пользователя
+# 1. Получить список товаров пользователя (постранично по курсору)
+# Следующая страница - в заголовке X-Next-Cursor (нет заголовка - это последняя),
+# количество (если просили count=estimate|exact) - в X-Total-Count.
 @router.get("/", response_model=List[ProductOut])
 async def get_products(
-    skip: int = 0, 
-    limit: int = 100, 
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    missing_costs: bool = False,            # Только товары без себестоимости
+    sku_prefix: Optional[str] = None,       # SKU начинается с ...
+    q: Optional[str] = None,                # Название содержит ...
+    count: Optional[str] = Query(None, pattern="^(estimate|exact)$"),
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    user_id: int = Depends(get_current_user_id)
 ):
     # Показываем товары ТОЛЬКО этого пользователя
-    result = await db.execute(
-        select(Product)
-        .where(Product.user_id == current_user.id)
-        .offset(skip)
-        .limit(limit)
-    )
+    query = select(Product).where(Product.user_id == user_id)
+    if missing_costs:
+        query = query.where(Product.has_costs.is_(False))
+    if sku_prefix:
+        query = query.where(Product.sku.startswith(sku_prefix, autoescape=True))
+    if q:
+        query = query.where(Product.name.icontains(q, autoescape=True))
+
+    if count == "exact":
+        response.headers["X-Total-Count"] = str(await exact_count(db, query))
+    elif count == "estimate":
+        response.headers["X-Total-Count"] = str(await estimated_count(db, query))
+
+    # Keyset вместо OFFSET: страница 1000 стоит столько же, сколько первая, и порядок стабилен
+    after_id = decode_cursor(cursor)
+    if after_id is not None:
+        query = query.where(Product.id > after_id)
+    result = await db.execute(query.order_by(Product.id).limit(limit + 1))
     products = result.scalars().all()
+
+    if len(products) > limit:
+        products = products[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(products[-1].id)
     return products
 
-# 2. Обновить себестоимость товара по SKU
+async def _bulk_update(db: AsyncSession, user_id: int, items: dict, invalid: list, started: float) -> ProductBulkResponse:
+    updated = await apply_cost_updates(db, user_id, items)
+    if updated:
+        await refresh_sku_days(db, user_id, sorted(updated))
+    await db.commit()
+    if updated:
+        await dashboard_cache.invalidate(user_id)
+        columnar_store.mark_costs_stale(user_id)
+
+    results = [
+        ProductBulkResult(sku=sku, status="updated" if sku in updated else "not_found")
+        for sku in items
+    ] + invalid
+    return ProductBulkResponse(
+        updated=len(updated),
+        not_found=len(items) - len(updated),
+        invalid=len(invalid),
+        elapsed_ms=round((time.perf_counter() - started) * 1000, 1),
+        results=results,
+    )
+
+# 2. Массово обновить себестоимость: JSON [{"sku": ..., "purchase_price": ...}, ...]
+# Объявлен до /{sku}, иначе "bulk" примется за артикул
+@router.patch("/bulk", response_model=ProductBulkResponse)
+async def bulk_update_product_costs(
+    items: List[dict] = Body(...),
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id)
+):
+    started = time.perf_counter()
+    valid, invalid = validate_items(items)
+    return await _bulk_update(db, user_id, valid, invalid, started)
+
+# 3. То же из CSV (выгрузка из таблицы): колонки sku + поля себестоимости
+@router.patch("/bulk/csv", response_model=ProductBulkResponse)
+async def bulk_update_product_costs_csv(
+    file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id)
+):
+    started = time.perf_counter()
+    try:
+        rows, invalid_rows = parse_costs_csv(await file.read())
+    except (ValueError, UnicodeDecodeError, pd.errors.ParserError) as e:
+        raise HTTPException(status_code=400, detail=f"Не удалось прочитать CSV: {e}")
+    valid, invalid = validate_items(rows)
+    return await _bulk_update(db, user_id, valid, invalid_rows + invalid, started)
+
+# 4. Обновить себестоимость товара по SKU
 @router.patch("/{sku}", response_model=ProductOut)
 async def update_product_costs(
     sku: str,
     product_update: ProductUpdate,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    user_id: int = Depends(get_current_user_id)
 ):
     # Ищем товар
     result = await db.execute(
         select(Product)
-        .where(Product.user_id == current_user.id, Product.sku == sku)
+        .where(Product.user_id == user_id, Product.sku == sku)
     )
     product = result.scalar_one_or_none()
 
@@ -51,6 +129,12 @@ async def update_product_costs(
     for key, value in update_data.items():
         setattr(product, key, value)
 
+    # Пересчитываем итоги только за дни, где продавался этот товар
+    await db.flush()
+    await refresh_sku_days(db, user_id, [sku])
+
     await db.commit()
     await db.refresh(product)
+    await dashboard_cache.invalidate(user_id)
+    columnar_store.mark_costs_stale(user_id)
     return product
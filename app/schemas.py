@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr
 from typing import Optional, List  # <--- ДОБАВИЛ List
-from datetime import date
+from datetime import date, datetime
 
 # Базовая схема токена (то, что мы отдадим фронтенду после логина)
 class Token(BaseModel):
@@ -26,9 +26,26 @@ class ProductUpdate(BaseModel):
     purchase_price: Optional[float] = None  # Закуп
     logistics_china: Optional[float] = None # Доставка Китай
     logistics_inner: Optional[float] = None # Фулфилмент
-    other_expenses: Optional[float] = None  # Упаковка/прочее
+    packaging_cost: Optional[float] = None  # Упаковка
+    other_expenses: Optional[float] = None  # Прочее
     kaspi_commission: Optional[float] = None # Комиссия (%)
 
+# Массовое обновление себестоимости (PATCH /products/bulk)
+class ProductBulkItem(ProductUpdate):
+    sku: str
+
+class ProductBulkResult(BaseModel):
+    sku: str
+    status: str                 # updated / not_found / invalid
+    error: Optional[str] = None
+
+class ProductBulkResponse(BaseModel):
+    updated: int
+    not_found: int
+    invalid: int
+    elapsed_ms: float
+    results: List[ProductBulkResult]
+
 # Схема для показа товара
 class ProductOut(BaseModel):
     id: int
@@ -37,8 +54,25 @@ class ProductOut(BaseModel):
     purchase_price: float
     logistics_china: float
     logistics_inner: float
+    packaging_cost: float
     other_expenses: float
     kaspi_commission: float
+    unit_cost: float        # Все расходы на штуку, кроме комиссии
+    has_costs: bool
+
+    class Config:
+        from_attributes = True
+
+# Настройки компании (налог, ссылка на таблицу)
+class CompanySettingsUpdate(BaseModel):
+    company_name: Optional[str] = None
+    tax_percent: Optional[float] = None
+    google_sheet_url: Optional[str] = None
+
+class CompanySettingsOut(BaseModel):
+    company_name: Optional[str] = None
+    tax_percent: float
+    google_sheet_url: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -62,4 +96,79 @@ class DashboardStats(BaseModel):
     chart_data: List[DailyStats]
     
     # Предупреждение: сколько товаров без себестоимости (чтобы ты знал, что статистика врет)
-    products_without_costs: int
\ No newline at end of file
+    products_without_costs: int
+
+# Итоги одного периода (GET /analytics/dashboard/windows)
+class PeriodTotals(BaseModel):
+    start: date
+    end: date                 # Включительно
+    revenue: float
+    profit: float
+    orders_count: int
+    margin_percent: float
+    roi_percent: float
+
+# Изменение к прошлому периоду; проценты - None, если в прошлом периоде был 0
+class PeriodDelta(BaseModel):
+    revenue: float
+    profit: float
+    orders_count: int
+    margin_points: float      # Разница маржинальности в процентных пунктах
+    revenue_percent: Optional[float] = None
+    profit_percent: Optional[float] = None
+    orders_percent: Optional[float] = None
+
+class WindowStats(BaseModel):
+    days: int
+    current: PeriodTotals
+    previous: Optional[PeriodTotals] = None   # Такой же отрезок прямо перед текущим
+    delta: Optional[PeriodDelta] = None
+
+class DashboardWindows(BaseModel):
+    windows: List[WindowStats]
+    products_without_costs: int
+
+# Задача фоновой синхронизации (POST /sync, GET /sync/{job_id})
+class SyncJobOut(BaseModel):
+    job_id: str
+    status: str               # queued / running / success / failed
+    created_at: datetime
+    rows_read: int
+    imported: int             # Новые заказы
+    changed: int = 0          # Уже были, но поля изменились
+    unchanged: int = 0        # Совпал отпечаток или старше водяной отметки
+    skipped: int              # Отклоненные строки (битые ячейки)
+    elapsed_sec: float
+    error: Optional[str] = None
+    result: Optional[dict] = None
+
+
+# "Что если": пересчет прибыли по массивам в памяти с подменой параметров
+class WhatIfRequest(BaseModel):
+    start_date: Optional[date] = None   # Если не задано - последние `days` дней
+    end_date: Optional[date] = None     # Включительно
+    days: int = 30
+    skus: Optional[List[str]] = None
+    commission_percent: Optional[float] = None  # Вместо комиссии из карточек товаров
+    tax_percent: Optional[float] = None         # Вместо налога из настроек
+
+
+# Прибыльность по товарам (GET /analytics/products)
+class ProductReportRow(BaseModel):
+    sku: str
+    name: Optional[str] = None
+    orders_count: int
+    units: int
+    revenue: float
+    cogs: float           # Себестоимость * Кол-во
+    commission: float
+    tax: float
+    delivery: float
+    profit: float
+    margin_percent: float
+    roi_percent: float
+
+class ProductReport(BaseModel):
+    total_skus: int       # Сколько товаров продавалось за период (до обрезки до top-N)
+    sort_by: str
+    items: List[ProductReportRow]
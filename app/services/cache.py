@@ -0,0 +1,152 @@
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Optional, Type
+
+from pydantic import BaseModel
+
+from app.config import settings
+from app.schemas import DashboardStats
+
+
+class TTLCache:
+    """LRU-кэш внутри процесса: ограничен по размеру, записи живут ttl секунд.
+    С именем (name) его счетчики попадают в /metrics."""
+
+    def __init__(self, maxsize: int, ttl: float, name: Optional[str] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0      # Вытеснено по размеру (LRU)
+        self.expirations = 0    # Истек TTL
+        self.invalidations = 0  # Удалено из-за изменения данных
+        if name is not None:
+            named_caches[name] = self
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + (ttl if ttl is not None else self.ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key) -> None:
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def delete_prefix(self, prefix: str) -> int:
+        with self._lock:
+            keys = [k for k in self._data if isinstance(k, str) and k.startswith(prefix)]
+            for k in keys:
+                del self._data[k]
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+# Кэши процесса по имени - для метрик
+named_caches: Dict[str, TTLCache] = {}
+
+
+class CacheBackend(ABC):
+    """Хранилище для кэша. Значения - строки, чтобы то же самое умел Redis
+    (get / set с EX / SCAN+DEL по префиксу)."""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[str]: ...
+
+    @abstractmethod
+    async def set(self, key: str, value: str, ttl: float) -> None: ...
+
+    @abstractmethod
+    async def delete_prefix(self, prefix: str) -> int: ...
+
+    @abstractmethod
+    async def stats(self) -> dict: ...
+
+
+class InMemoryBackend(CacheBackend):
+    def __init__(self, maxsize: int, ttl: float, name: Optional[str] = None):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl, name=name)
+
+    async def get(self, key: str) -> Optional[str]:
+        return self._cache.get(key)
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        self._cache.set(key, value, ttl)
+
+    async def delete_prefix(self, prefix: str) -> int:
+        return self._cache.delete_prefix(prefix)
+
+    async def stats(self) -> dict:
+        return {"backend": "memory", **self._cache.stats()}
+
+
+class DashboardCache:
+    """DashboardStats по (user_id, days). Сбрасывается целиком для пользователя,
+    когда меняются его данные: синк, себестоимость, настройки компании.
+    Другие сводки (model) лежат под тем же префиксом и сбрасываются вместе."""
+
+    def __init__(self, backend: CacheBackend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+
+    @staticmethod
+    def _prefix(user_id: int) -> str:
+        return f"dashboard:{user_id}:"
+
+    async def get(self, user_id: int, days, model: Type[BaseModel] = DashboardStats) -> Optional[BaseModel]:
+        raw = await self.backend.get(f"{self._prefix(user_id)}{days}")
+        return model.model_validate_json(raw) if raw is not None else None
+
+    async def set(self, user_id: int, days, stats: BaseModel) -> None:
+        await self.backend.set(f"{self._prefix(user_id)}{days}", stats.model_dump_json(), self.ttl)
+
+    async def invalidate(self, user_id: int) -> None:
+        await self.backend.delete_prefix(self._prefix(user_id))
+
+    async def stats(self) -> dict:
+        return await self.backend.stats()
+
+
+dashboard_cache = DashboardCache(
+    InMemoryBackend(maxsize=settings.DASHBOARD_CACHE_MAX_ENTRIES, ttl=settings.DASHBOARD_CACHE_TTL_SECONDS, name="dashboard"),
+    ttl=settings.DASHBOARD_CACHE_TTL_SECONDS,
+)
@@ -0,0 +1,122 @@
+from dataclasses import dataclass, field
+from typing import List
+import pandas as pd
+
+# Форматы дат в выгрузках Каспи: "29.03.2025", "29.03.2025 14:00", иногда "29.03.25 14:00"
+DATE_FORMATS = (
+    '%d.%m.%Y %H:%M:%S',
+    '%d.%m.%Y %H:%M',
+    '%d.%m.%Y',
+    '%d.%m.%y %H:%M',
+    '%d.%m.%y',
+)
+
+# Пробелы-разделители тысяч (обычный, NBSP, узкий NBSP) и знак тенге
+_NUMBER_JUNK = r'[\s\u00a0\u202f₸]'
+
+# Сколько отклоненных строк отдаем в ответе (полное количество считаем всегда)
+REJECTED_SAMPLE_SIZE = 100
+
+
+@dataclass
+class CleanResult:
+    frame: pd.DataFrame                 # Чистые строки, готовые к записи
+    rejected: List[dict] = field(default_factory=list)  # {"row", "column", "value", "reason"}
+
+
+def _as_text(series: pd.Series) -> pd.Series:
+    return series.astype('string').str.strip()
+
+
+def _blank(text: pd.Series) -> pd.Series:
+    return text.isna() | (text == '')
+
+
+def parse_numbers(series: pd.Series) -> pd.Series:
+    """'12 500,50' / '12\\xa0500,50' / '1,0' -> float. Пустое и мусор -> NaN."""
+    cleaned = (
+        _as_text(series)
+        .str.replace(_NUMBER_JUNK, '', regex=True)
+        .str.replace(',', '.', regex=False)
+    )
+    return pd.to_numeric(cleaned, errors='coerce').astype(float)
+
+
+def parse_dates(series: pd.Series) -> pd.Series:
+    """'dd.mm.yyyy [HH:MM]' -> datetime64. Каждый следующий формат пробуем только на нераспознанных."""
+    text = _as_text(series)
+    result = pd.Series(pd.NaT, index=series.index, dtype='datetime64[ns]')
+    for fmt in DATE_FORMATS:
+        pending = result.isna() & ~_blank(text)
+        if not pending.any():
+            break
+        result[pending] = pd.to_datetime(text[pending], format=fmt, errors='coerce')
+    return result
+
+
+def _column(df: pd.DataFrame, col: str) -> pd.Series:
+    if col not in df.columns:
+        return pd.Series(pd.NA, index=df.index, dtype='string')
+    return df[col]
+
+
+def normalize_orders(df: pd.DataFrame) -> CleanResult:
+    """Чистит выгрузку (колонки уже переименованы в наши поля) одним проходом по колонкам.
+
+    Плохие ячейки не превращаются молча в 0.0 / datetime.now(): строка уходит в rejected
+    с номером строки файла (заголовок = строка 1), колонкой, значением и причиной.
+    """
+    kaspi_id = _as_text(_column(df, 'kaspi_id'))
+    sku = _as_text(_column(df, 'sku'))
+
+    raw_amount = _column(df, 'amount')
+    amount = parse_numbers(raw_amount)
+
+    raw_date = _column(df, 'order_date')
+    order_date = parse_dates(raw_date)
+
+    # Пустая доставка - это 0, пустое количество - это 1, а вот мусор - ошибка
+    raw_delivery = _column(df, 'delivery_cost')
+    delivery = parse_numbers(raw_delivery)
+    delivery_blank = _blank(_as_text(raw_delivery))
+
+    raw_qty = _column(df, 'quantity')
+    quantity = parse_numbers(raw_qty)
+    qty_blank = _blank(_as_text(raw_qty))
+
+    checks = [
+        ('kaspi_id', kaspi_id, _blank(kaspi_id), 'пустой номер заказа'),
+        ('sku', sku, _blank(sku), 'пустой артикул'),
+        ('amount', raw_amount, amount.isna(), 'не число'),
+        ('order_date', raw_date, order_date.isna(), 'дата не в формате дд.мм.гггг [ЧЧ:ММ]'),
+        ('delivery_cost', raw_delivery, delivery.isna() & ~delivery_blank, 'не число'),
+        ('quantity', raw_qty, (quantity.isna() & ~qty_blank) | (quantity <= 0), 'не положительное число'),
+    ]
+
+    bad = pd.Series(False, index=df.index)
+    rejected = []
+    for col, values, mask, reason in checks:
+        mask = mask.fillna(False).astype(bool)
+        if mask.any():
+            bad |= mask
+            for idx, value in values[mask].items():
+                rejected.append({
+                    'row': int(idx) + 2,
+                    'column': col,
+                    'value': None if pd.isna(value) else str(value),
+                    'reason': reason,
+                })
+
+    good = ~bad
+    frame = pd.DataFrame({
+        'kaspi_id': kaspi_id[good].astype(object),
+        'sku': sku[good].astype(object),
+        'product_name': _as_text(_column(df, 'product_name'))[good].fillna('').astype(object),
+        'amount': amount[good],
+        'status': _as_text(_column(df, 'status'))[good].fillna('').astype(object),
+        'order_date': order_date[good],
+        'quantity': quantity[good].fillna(1).astype(int),
+        'delivery_cost': delivery[good].fillna(0.0),
+    })
+    rejected.sort(key=lambda r: (r['row'], r['column']))
+    return CleanResult(frame=frame, rejected=rejected)
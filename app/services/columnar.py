@@ -0,0 +1,238 @@
+"""История заказов пользователя в NumPy-массивах для быстрых "что если" расчетов.
+
+Формула прибыли та же, что в stats.line_profit, только векторная: окно дат, фильтр по SKU
+и подмена комиссии/налога считаются за миллисекунды без запросов в Postgres.
+"""
+import time
+from collections import namedtuple
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.config import settings
+from app.models import Order, Product, SyncState
+from app.schemas import DashboardStats
+from app.services.cache import TTLCache
+from app.services.stats import EXCLUDED_STATUSES, build_dashboard, get_tax_percent
+
+_EPOCH = date(1970, 1, 1)
+
+_DayRow = namedtuple("_DayRow", "day revenue profit orders_count")
+
+
+def _day_index(d: date) -> int:
+    return (d - _EPOCH).days
+
+
+@dataclass
+class TenantOrders:
+    user_id: int
+    max_order_id: int
+
+    # По строке на заказ
+    day: np.ndarray          # int32, дней с 1970-01-01
+    amount: np.ndarray       # float64
+    quantity: np.ndarray     # int32, уже >= 1
+    delivery: np.ndarray     # float64
+    status: np.ndarray       # int16, код в status_names
+    sku: np.ndarray          # int32, код в sku_names
+
+    # Справочники кодов
+    status_names: List[str]
+    sku_names: List[str]
+
+    # По строке на SKU (индекс = код SKU)
+    unit_cost: np.ndarray = None        # products.unit_cost
+    commission_pct: np.ndarray = None
+    without_costs: np.ndarray = None    # нет товара или не заполнен закуп
+    products_without_costs: int = 0     # по всем товарам, в том числе без заказов
+    tax_percent: float = 0.0
+    costs_stale: bool = True
+    costs_loaded: float = 0.0           # time.monotonic() последнего чтения справочника
+    synced_at: Optional[datetime] = None  # sync_states.last_synced_at, с которым читали заказы
+    load_ms: float = 0.0
+
+    @property
+    def size(self) -> int:
+        return len(self.amount)
+
+
+def _encode(values: pd.Series, names: List[str]) -> np.ndarray:
+    # Коды по существующему справочнику, новые значения дописываем в конец
+    values = values.fillna("").astype(str)
+    known = set(names)
+    names.extend(v for v in pd.unique(values) if v not in known)
+    return pd.Index(names).get_indexer(values).astype(np.int32)
+
+
+async def _load_orders(db: AsyncSession, user_id: int, after_id: int = 0) -> pd.DataFrame:
+    result = await db.execute(
+        select(
+            Order.id, Order.order_date, Order.amount, Order.quantity,
+            Order.delivery_cost_for_seller, Order.status, Order.sku,
+        )
+        .where(Order.user_id == user_id, Order.id > after_id, Order.order_date.is_not(None))
+        .order_by(Order.id)
+    )
+    return pd.DataFrame(
+        result.all(),
+        columns=["id", "order_date", "amount", "quantity", "delivery", "status", "sku"],
+    )
+
+
+def _append(tenant: TenantOrders, df: pd.DataFrame) -> None:
+    if df.empty:
+        return
+    day = pd.to_datetime(df["order_date"]).values.astype("datetime64[D]").astype(np.int64).astype(np.int32)
+    qty = pd.to_numeric(df["quantity"]).fillna(0).to_numpy()
+    tenant.day = np.concatenate([tenant.day, day])
+    tenant.amount = np.concatenate([tenant.amount, pd.to_numeric(df["amount"]).fillna(0.0).to_numpy(np.float64)])
+    tenant.quantity = np.concatenate([tenant.quantity, np.where(qty > 0, qty, 1).astype(np.int32)])
+    tenant.delivery = np.concatenate([tenant.delivery, pd.to_numeric(df["delivery"]).fillna(0.0).to_numpy(np.float64)])
+    tenant.status = np.concatenate([tenant.status, _encode(df["status"], tenant.status_names).astype(np.int16)])
+    tenant.sku = np.concatenate([tenant.sku, _encode(df["sku"], tenant.sku_names)])
+    tenant.max_order_id = int(df["id"].iloc[-1])
+    # Могли появиться новые SKU - справочник себестоимости надо достроить
+    tenant.costs_stale = True
+
+
+async def _load_costs(db: AsyncSession, tenant: TenantOrders) -> None:
+    result = await db.execute(
+        select(Product.sku, Product.unit_cost, Product.has_costs, Product.kaspi_commission)
+        .where(Product.user_id == tenant.user_id)
+    )
+    n = len(tenant.sku_names)
+    unit_cost = np.zeros(n)
+    commission = np.zeros(n)
+    without_costs = np.ones(n, dtype=bool)
+    products_without_costs = 0
+    codes = {name: code for code, name in enumerate(tenant.sku_names)}
+    for sku, cost, has_costs, comm in result.all():
+        products_without_costs += not has_costs
+        code = codes.get(sku)
+        if code is None:
+            continue
+        unit_cost[code] = cost or 0
+        commission[code] = comm or 0
+        without_costs[code] = not has_costs
+
+    tenant.unit_cost = unit_cost
+    tenant.commission_pct = commission
+    tenant.without_costs = without_costs
+    tenant.products_without_costs = products_without_costs
+    tenant.tax_percent = await get_tax_percent(db, tenant.user_id)
+    tenant.costs_stale = False
+    tenant.costs_loaded = time.monotonic()
+
+
+async def _last_synced_at(db: AsyncSession, user_id: int) -> Optional[datetime]:
+    return await db.scalar(select(SyncState.last_synced_at).where(SyncState.user_id == user_id))
+
+
+def compute(
+    tenant: TenantOrders,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    skus: Optional[Iterable[str]] = None,
+    commission_percent: Optional[float] = None,
+    tax_percent: Optional[float] = None,
+) -> DashboardStats:
+    """Формула get_dashboard_stats по массивам. end - включительно."""
+    excluded = np.array([name in EXCLUDED_STATUSES for name in tenant.status_names], dtype=bool)
+    mask = ~excluded[tenant.status]
+    products_without_costs = tenant.products_without_costs
+    if start is not None:
+        mask &= tenant.day >= _day_index(start)
+    if end is not None:
+        mask &= tenant.day <= _day_index(end)
+    if skus is not None:
+        codes = {name: code for code, name in enumerate(tenant.sku_names)}
+        wanted = np.zeros(len(tenant.sku_names), dtype=bool)
+        wanted[[codes[s] for s in skus if s in codes]] = True
+        mask &= wanted[tenant.sku]
+        products_without_costs = int(np.count_nonzero(wanted & tenant.without_costs))
+
+    sku = tenant.sku[mask]
+    revenue = tenant.amount[mask]
+    comm_pct = tenant.commission_pct[sku] if commission_percent is None else commission_percent
+    tax = tenant.tax_percent if tax_percent is None else tax_percent
+
+    total_cogs = tenant.unit_cost[sku] * tenant.quantity[mask] + revenue * (comm_pct / 100.0)
+    profit = revenue - total_cogs - revenue * (tax / 100) - tenant.delivery[mask]
+
+    # Группировка по дням: bincount по смещению от первого дня окна
+    day = tenant.day[mask]
+    if day.size == 0:
+        return build_dashboard([], products_without_costs)
+    first = int(day.min())
+    offset = day - first
+    revenue_by_day = np.bincount(offset, weights=revenue)
+    profit_by_day = np.bincount(offset, weights=profit)
+    count_by_day = np.bincount(offset)
+
+    rows = [
+        _DayRow(
+            day=date.fromordinal(_EPOCH.toordinal() + first + int(i)),
+            revenue=float(revenue_by_day[i]),
+            profit=float(profit_by_day[i]),
+            orders_count=int(count_by_day[i]),
+        )
+        for i in np.flatnonzero(count_by_day)
+    ]
+    return build_dashboard(rows, products_without_costs)
+
+
+class ColumnarStore:
+    """Массивы по пользователям. Ограничено по числу пользователей (LRU) и по времени жизни.
+
+    Синк и правки себестоимости могли пройти в другом воркере: заказы перечитываем, если сменилось
+    sync_states.last_synced_at, справочник себестоимости и налог - не реже DASHBOARD_CACHE_TTL_SECONDS.
+    """
+
+    def __init__(self, max_tenants: int, ttl: float):
+        self._tenants = TTLCache(maxsize=max_tenants, ttl=ttl, name="columnar")
+
+    async def get(self, db: AsyncSession, user_id: int) -> TenantOrders:
+        synced_at = await _last_synced_at(db, user_id)
+        tenant = self._tenants.get(user_id)
+        if tenant is None or tenant.synced_at != synced_at:
+            started = time.perf_counter()
+            tenant = TenantOrders(
+                user_id=user_id, max_order_id=0,
+                day=np.empty(0, np.int32), amount=np.empty(0), quantity=np.empty(0, np.int32),
+                delivery=np.empty(0), status=np.empty(0, np.int16), sku=np.empty(0, np.int32),
+                status_names=[], sku_names=[], synced_at=synced_at,
+            )
+            _append(tenant, await _load_orders(db, user_id))
+            tenant.load_ms = round((time.perf_counter() - started) * 1000, 1)
+            self._tenants.set(user_id, tenant)
+        if tenant.costs_stale or time.monotonic() - tenant.costs_loaded > settings.DASHBOARD_CACHE_TTL_SECONDS:
+            await _load_costs(db, tenant)
+        return tenant
+
+    async def refresh(self, db: AsyncSession, user_id: int) -> None:
+        """После синка: дочитываем только новые заказы (id > последнего загруженного)."""
+        tenant = self._tenants.get(user_id)
+        if tenant is not None:
+            _append(tenant, await _load_orders(db, user_id, after_id=tenant.max_order_id))
+            tenant.synced_at = await _last_synced_at(db, user_id)
+
+    def mark_costs_stale(self, user_id: int) -> None:
+        # Себестоимость или налог поменялись - перечитаем справочник при следующем расчете
+        tenant = self._tenants.get(user_id)
+        if tenant is not None:
+            tenant.costs_stale = True
+
+    def forget(self, user_id: int) -> None:
+        self._tenants.delete(user_id)
+
+
+columnar_store = ColumnarStore(
+    max_tenants=settings.COLUMNAR_MAX_TENANTS,
+    ttl=settings.COLUMNAR_TTL_SECONDS,
+)
@@ -0,0 +1,122 @@
+import asyncio
+import gzip
+import tempfile
+from dataclasses import dataclass
+from typing import IO, Optional
+
+import httpx
+
+from app.config import settings
+
+_GZIP_MAGIC = b"\x1f\x8b"
+
+
+class DownloadError(OSError):
+    """Сеть, HTTP-ошибка или слишком большой файл. OSError - чтобы импорт ловил как раньше."""
+
+
+@dataclass
+class Download:
+    file: Optional[IO[bytes]]           # None - файл не менялся (304). Закрывает вызывающий
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    size: int = 0                       # Скачано байт
+
+    @property
+    def not_modified(self) -> bool:
+        return self.file is None
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    # Один клиент на процесс: пул соединений и TLS-сессии переиспользуются между синками
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.DOWNLOAD_TIMEOUT_SECONDS, connect=settings.DOWNLOAD_CONNECT_TIMEOUT_SECONDS),
+            limits=httpx.Limits(max_connections=settings.DOWNLOAD_MAX_CONNECTIONS),
+            follow_redirects=True,  # Опубликованные Google Sheets отдают CSV через редирект
+        )
+    return _client
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _ungzip(spool: IO[bytes]) -> IO[bytes]:
+    # Сам файл может быть .csv.gz (Content-Encoding: gzip httpx распаковывает сам)
+    spool.seek(0)
+    if spool.read(2) != _GZIP_MAGIC:
+        spool.seek(0)
+        return spool
+    spool.seek(0)
+    plain = tempfile.SpooledTemporaryFile(max_size=settings.DOWNLOAD_SPOOL_MEMORY_BYTES)
+    size = 0
+    try:
+        with gzip.GzipFile(fileobj=spool, mode="rb") as packed:
+            while block := packed.read(1024 * 1024):
+                size += len(block)
+                # Потолок размера - и после распаковки тоже
+                if size > settings.DOWNLOAD_MAX_BYTES:
+                    raise DownloadError(f"Файл больше {settings.DOWNLOAD_MAX_BYTES} байт")
+                plain.write(block)
+    except BaseException:
+        plain.close()
+        raise
+    finally:
+        spool.close()
+    plain.seek(0)
+    return plain
+
+
+async def download_csv(url: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> Download:
+    """Скачивает выгрузку потоком во временный файл (в памяти до DOWNLOAD_SPOOL_MEMORY_BYTES,
+    дальше - на диске). Условный запрос: если таблица не менялась, сервер ответит 304 без тела."""
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    max_bytes = settings.DOWNLOAD_MAX_BYTES
+    spool = tempfile.SpooledTemporaryFile(max_size=settings.DOWNLOAD_SPOOL_MEMORY_BYTES)
+    try:
+        async with get_client().stream("GET", url, headers=headers) as response:
+            if response.status_code == 304:
+                spool.close()
+                return Download(file=None, etag=etag, last_modified=last_modified)
+            response.raise_for_status()
+
+            declared = response.headers.get("Content-Length")
+            if declared and declared.isdigit() and int(declared) > max_bytes:
+                raise DownloadError(f"Файл больше {max_bytes} байт")
+            size = 0
+            async for chunk in response.aiter_bytes():
+                size += len(chunk)
+                if size > max_bytes:
+                    raise DownloadError(f"Файл больше {max_bytes} байт")
+                spool.write(chunk)
+
+            file = await asyncio.to_thread(_ungzip, spool)
+            return Download(
+                file=file,
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+                size=size,
+            )
+    except httpx.HTTPError as e:
+        spool.close()
+        raise DownloadError(str(e)) from e
+    except BaseException:
+        spool.close()
+        raise
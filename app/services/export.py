@@ -0,0 +1,59 @@
+import csv
+import io
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Optional
+
+from app.database import AsyncSessionLocal
+from app.services.stats import get_tax_percent, orders_export_query
+
+EXPORT_COLUMNS = [
+    "kaspi_id", "order_date", "sku", "product_name", "status", "quantity", "amount",
+    "cogs", "commission", "tax", "delivery", "profit", "counted",
+]
+
+# Строк за одну выборку с серверного курсора (и за один кусок ответа)
+ROWS_PER_FETCH = 2000
+
+
+def _format(value):
+    if isinstance(value, float):
+        return round(value, 2)
+    if isinstance(value, datetime):
+        return value.strftime("%d.%m.%Y %H:%M")
+    return value
+
+
+async def _csv_chunks(user_id: int, start_date: Optional[datetime]) -> AsyncIterator[bytes]:
+    # Своя сессия: генератор живет дольше, чем обработчик запроса
+    async with AsyncSessionLocal() as db:
+        tax_percent = await get_tax_percent(db, user_id)
+        query = orders_export_query(user_id, tax_percent, start_date).execution_options(yield_per=ROWS_PER_FETCH)
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        buffer.write("\ufeff")  # BOM - чтобы Excel понял UTF-8 и кириллицу
+        writer.writerow(EXPORT_COLUMNS)
+        yield buffer.getvalue().encode()
+
+        # Серверный курсор: в памяти только текущая пачка, первый байт уходит сразу
+        result = await db.stream(query)
+        async for rows in result.partitions():
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows([_format(v) for v in row] for row in rows)
+            yield buffer.getvalue().encode()
+
+
+async def export_orders_csv(user_id: int, start_date: Optional[datetime], gzip: bool = False) -> AsyncIterator[bytes]:
+    if not gzip:
+        async for chunk in _csv_chunks(user_id, start_date):
+            yield chunk
+        return
+
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31 = формат gzip
+    async for chunk in _csv_chunks(user_id, start_date):
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -1,105 +1,452 @@
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+import numpy as np
 import pandas as pd
+from sqlalchemy import BigInteger, DateTime, Float, Integer, String, column, delete, func, tuple_, update, values
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from app.models import Order, Product
-from datetime import datetime
+from app.config import settings
+from app.core.metrics import observe_import_stage
+from app.core.sql import dialect_insert, values_cast
+from app.models import Order, Product, SyncState
+from app.services.cache import dashboard_cache
+from app.services.cleaning import normalize_orders, parse_dates, REJECTED_SAMPLE_SIZE
+from app.services.columnar import columnar_store
+from app.services.downloader import download_csv
+from app.services import partitions
+from app.services.rollups import refresh_days
 
-async def sync_kaspi_data(csv_url: str, user_id: int, db: AsyncSession):
-    # 1. Скачиваем данные через Pandas
-    try:
-        df = pd.read_csv(csv_url)
-    except Exception as e:
-        return {"error": f"Не удалось скачать файл: {str(e)}"}
+# Колонки выгрузки Каспи -> наши поля
+# ВАЖНО: В конце каждой строки должна быть запятая!
+COLUMN_MAP = {
+    '№ заказа': 'kaspi_id',
+    'Артикул': 'sku',
+    'Сумма': 'amount',
+    'Статус': 'status',
+    'Дата поступления заказа': 'order_date',
+    'Стоимость доставки для продавца': 'delivery_cost',
+    'Название товара в Kaspi Магазине': 'product_name',
+    'Количество': 'quantity',
+}
 
-    # 2. Переименуем колонки для удобства
-    # ВАЖНО: В конце каждой строки должна быть запятая!
-    column_map = {
-        '№ заказа': 'kaspi_id',
-        'Артикул': 'sku',
-        'Сумма': 'amount',
-        'Статус': 'status',
-        'Дата поступления заказа': 'order_date',
-        'Стоимость доставки для продавца': 'delivery_cost',
-        'Название товара в Kaspi Магазине': 'product_name',
-        'Количество': 'quantity' 
-    }
-    df = df.rename(columns=column_map)
-    
-    # Оставляем только нужные колонки (пересечение)
-    needed_cols = list(column_map.values())
-    df = df[df.columns.intersection(needed_cols)]
-
-    imported_count = 0
-    
-    # 3. Проходимся по каждой строке
-    for index, row in df.iterrows():
-        # --- Очистка данных ---
-        
-        # Парсим дату
-        try:
-            # Каспи обычно дает дату как "29.03.2025" или "29.03.25 14:00"
-            date_str = str(row['order_date']).split(' ')[0] # Берем только дату
-            date_obj = datetime.strptime(date_str, "%d.%m.%Y")
-        except:
-            date_obj = datetime.now()
-
-        # Чистим SKU
-        sku_clean = str(row['sku']).strip()
-        
-        # --- Работа с Товаром (Product) ---
-        stmt = select(Product).where(Product.user_id == user_id, Product.sku == sku_clean)
-        result = await db.execute(stmt)
-        existing_product = result.scalar_one_or_none()
-
-        if not existing_product:
-            new_product = Product(
-                user_id=user_id,
-                sku=sku_clean,
-                name=str(row.get('product_name', 'Unknown')),
-                purchase_price=0.0
+# Сколько строк уходит в один INSERT / один поиск по ключам.
+# asyncpg не принимает больше 32767 параметров на запрос: 1000 строк * 9 полей - с запасом
+CHUNK_SIZE = 1000
+
+# Поля заказа, изменение которых делает строку "измененной" (kaspi_id - ключ, в отпечаток не входит)
+HASH_COLUMNS = ['sku', 'product_name', 'amount', 'status', 'order_date', 'quantity', 'delivery_cost']
+
+IMPORT_STAGES = ('download', 'parse', 'clean', 'write')
+
+# Класс pg_try_advisory_xact_lock(класс, user_id): синки одного пользователя из разных процессов не идут разом
+SYNC_LOCK_CLASS = 7301
+
+logger = logging.getLogger(__name__)
+
+
+def _chunks(items: list, size: int = CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+@dataclass
+class OrderCounts:
+    new: int = 0
+    changed: int = 0      # Заказ уже есть, но поля в выгрузке другие - обновляем
+    unchanged: int = 0    # Отпечаток совпал - в базу не пишем
+
+
+# Поля заказа из выгрузки в порядке колонок VALUES для массового UPDATE
+_ORDER_VALUES = [
+    ('kaspi_id', String),
+    ('sku', String),
+    ('product_name', String),
+    ('amount', Float),
+    ('status', String),
+    ('order_date', DateTime),
+    ('quantity', Integer),
+    ('delivery_cost_for_seller', Float),
+    ('row_hash', BigInteger),
+]
+
+
+def _order_rows(user_id: int, df: pd.DataFrame, row_hash: pd.Series) -> list:
+    return [
+        {
+            'user_id': user_id,
+            'kaspi_id': kaspi_id,
+            'sku': sku,
+            'product_name': name,
+            'amount': float(amount),
+            'status': status,
+            'order_date': order_date.to_pydatetime(),
+            'quantity': int(qty),
+            'delivery_cost_for_seller': float(delivery),
+            'row_hash': int(fingerprint),
+        }
+        for kaspi_id, sku, name, amount, status, order_date, qty, delivery, fingerprint in zip(
+            df['kaspi_id'], df['sku'], df['product_name'], df['amount'], df['status'],
+            df['order_date'], df['quantity'], df['delivery_cost'], row_hash,
+        )
+    ]
+
+
+def row_fingerprints(df: pd.DataFrame) -> pd.Series:
+    """Отпечаток строки одним векторным проходом: uint64 -> BIGINT (со знаком) для Postgres."""
+    hashed = pd.util.hash_pandas_object(df[HASH_COLUMNS], index=False)
+    return pd.Series(hashed.to_numpy().view(np.int64), index=df.index)
+
+
+class _BulkWriter:
+    """Пишет товары и заказы пачками и считает, сколько запросов ушло в базу."""
+
+    def __init__(self, db: AsyncSession, user_id: int):
+        self.db = db
+        self.user_id = user_id
+        self.statements = 0
+        self.bind = getattr(db, "bind", None)
+        dialect_name = self.bind.dialect.name if self.bind is not None else "postgresql"
+        self.insert = dialect_insert(dialect_name)
+        self.cast = values_cast(dialect_name)
+        self.touched_days = set()  # Дни с новыми/измененными заказами - для пересчета итогов
+        self.seen_orders = set()   # kaspi_id из прежних кусков файла
+
+    async def execute(self, stmt):
+        self.statements += 1
+        return await self.db.execute(stmt)
+
+    async def existing(self, column, keys: list) -> set:
+        # Один запрос по ключам на пачку вместо SELECT на каждую строку
+        model = column.class_
+        found = set()
+        for chunk in _chunks(keys):
+            result = await self.execute(
+                select(column).where(model.user_id == self.user_id, column.in_(chunk))
+            )
+            found.update(result.scalars().all())
+        return found
+
+    async def fingerprints(self, keys: list) -> pd.DataFrame:
+        # kaspi_id -> row_hash (NULL - заказ из старых синков) и дата уже записанных заказов
+        found = []
+        for chunk in _chunks(keys):
+            result = await self.execute(
+                select(Order.kaspi_id, Order.row_hash, Order.order_date)
+                .where(Order.user_id == self.user_id, Order.kaspi_id.in_(chunk))
             )
-            db.add(new_product)
-            await db.commit() 
-
-        # --- Работа с Заказом (Order) ---
-        kaspi_order_id = str(row['kaspi_id'])
-        stmt_order = select(Order).where(Order.user_id == user_id, Order.kaspi_id == kaspi_order_id)
-        res_order = await db.execute(stmt_order)
-        existing_order = res_order.scalar_one_or_none()
-
-        if not existing_order:
-            # Получаем количество (если пусто или ошибка, ставим 1)
-            qty_val = 1
-            try:
-                raw_qty = row.get('quantity', 1)
-                qty_val = int(float(str(raw_qty).replace(',', '.'))) # защита от "1,0"
-            except:
-                qty_val = 1
-            
-            # Чистим цену и доставку от пробелов
-            try:
-                amount_val = float(str(row['amount']).replace(',', '.').replace(' ', '').replace('\xa0', ''))
-            except:
-                amount_val = 0.0
-
-            try:
-                delivery_val = float(str(row.get('delivery_cost', 0)).replace(',', '.').replace(' ', '').replace('\xa0', ''))
-            except:
-                delivery_val = 0.0
-
-            new_order = Order(
-                user_id=user_id,
-                kaspi_id=kaspi_order_id,
-                sku=sku_clean,
-                product_name=str(row.get('product_name', '')),
-                amount=amount_val,
-                status=str(row['status']),
-                order_date=date_obj,
-                quantity=qty_val,
-                delivery_cost_for_seller=delivery_val
+            found.extend(result.all())
+        stored = pd.DataFrame(found, columns=['kaspi_id', 'row_hash', 'order_date'])
+        # База уже не держит один kaspi_id (ключ - с order_date): дубль с другой датой оставляем
+        # самый поздний, остальные удаляем - иначе map по kaspi_id падает на неуникальном индексе
+        stored = stored.sort_values('order_date', ascending=False, kind='stable')
+        duplicates = stored.duplicated('kaspi_id')
+        if duplicates.any():
+            await self.delete_orders(stored[duplicates])
+        stored = stored[~duplicates].set_index('kaspi_id')
+        # Int64, а не float: 64-битный отпечаток не должен терять точность из-за NULL
+        return stored.astype({'row_hash': 'Int64'})
+
+    async def insert_many(self, model, rows: list, conflict_keys: list) -> None:
+        # Многострочный INSERT ... ON CONFLICT DO NOTHING: параллельный sync не упадет на дубле
+        for chunk in _chunks(rows):
+            await self.execute(
+                self.insert(model).values(chunk).on_conflict_do_nothing(index_elements=conflict_keys)
+            )
+
+    async def update_orders(self, rows: list) -> None:
+        # UPDATE orders ... FROM (VALUES ...): одна команда на пачку вместо UPDATE на заказ
+        for chunk in _chunks(rows):
+            v = values(*(column(name, type_) for name, type_ in _ORDER_VALUES), name="v").data(
+                [tuple(row[name] for name, _ in _ORDER_VALUES) for row in chunk]
+            )
+            await self.execute(
+                update(Order)
+                .where(Order.user_id == self.user_id, Order.kaspi_id == v.c.kaspi_id)
+                # cast: без контекста Postgres считает параметры VALUES текстом
+                .values({name: self.cast(v.c[name], type_) for name, type_ in _ORDER_VALUES if name != 'kaspi_id'})
+                .execution_options(synchronize_session=False)
+            )
+
+    async def delete_orders(self, rows: pd.DataFrame) -> None:
+        logger.warning("sync user=%s: removing %s duplicate orders", self.user_id, len(rows))
+        keys = list(zip(rows['kaspi_id'], pd.to_datetime(rows['order_date']).dt.to_pydatetime()))
+        for chunk in _chunks(keys):
+            await self.execute(
+                delete(Order)
+                .where(Order.user_id == self.user_id, tuple_(Order.kaspi_id, Order.order_date).in_(chunk))
+                .execution_options(synchronize_session=False)
+            )
+        self.touched_days.update(d.date() for _, d in keys)
+
+    async def write_products(self, df: pd.DataFrame) -> int:
+        products = df.drop_duplicates('sku')
+        known = await self.existing(Product.sku, products['sku'].tolist())
+        new_products = products[~products['sku'].isin(known)]
+
+        rows = [
+            {
+                'user_id': self.user_id,
+                'sku': sku,
+                'name': name or 'Unknown',
+                'purchase_price': 0.0,
+                'logistics_china': 0.0,
+                'logistics_inner': 0.0,
+                'packaging_cost': 0.0,
+                'other_expenses': 0.0,
+                'kaspi_commission': 0.0,
+            }
+            for sku, name in zip(new_products['sku'], new_products['product_name'])
+        ]
+        await self.insert_many(Product, rows, ['user_id', 'sku'])
+        return len(rows)
+
+    async def write_orders(self, df: pd.DataFrame) -> OrderCounts:
+        # Повтор kaspi_id в файле - и в том же куске, и в следующих: в счет идет первая строка,
+        # иначе на каждом синке заказ перезаписывался бы второй строкой и сразу считался измененным
+        orders = df.drop_duplicates('kaspi_id')
+        orders = orders[~orders['kaspi_id'].isin(self.seen_orders)]
+        self.seen_orders.update(orders['kaspi_id'])
+        row_hash = row_fingerprints(orders)
+        stored = await self.fingerprints(orders['kaspi_id'].tolist())
+        stored_hash = orders['kaspi_id'].map(stored['row_hash'])
+
+        is_new = ~orders['kaspi_id'].isin(stored.index)
+        is_changed = ~is_new & stored_hash.ne(row_hash).fillna(True).astype(bool)
+
+        new_rows = _order_rows(self.user_id, orders[is_new], row_hash[is_new])
+        await self.insert_many(Order, new_rows, ['user_id', 'kaspi_id', 'order_date'])
+
+        # Отмены/возвраты и правки суммы: пересчитать надо и старый день заказа, и новый
+        changed = orders[is_changed]
+        await self.update_orders(_order_rows(self.user_id, changed, row_hash[is_changed]))
+
+        self.touched_days.update(orders.loc[is_new | is_changed, 'order_date'].dt.date.unique())
+        self.touched_days.update(
+            pd.to_datetime(stored.loc[changed['kaspi_id'], 'order_date']).dropna().dt.date.unique()
+        )
+        return OrderCounts(
+            new=len(new_rows),
+            changed=len(changed),
+            unchanged=int((~is_new & ~is_changed).sum()),
+        )
+
+
+@dataclass
+class ImportStats:
+    rows_read: int = 0
+    imported: int = 0           # Новые заказы
+    changed: int = 0
+    unchanged: int = 0
+    products_created: int = 0
+    rejected: int = 0
+    chunks: int = 0
+    days_refreshed: int = 0
+    statements: int = 0
+    started: float = field(default_factory=time.perf_counter)
+    rejected_rows: List[dict] = field(default_factory=list)
+    # Секунды по этапам: download / parse / clean / write
+    stages: Dict[str, float] = field(default_factory=lambda: dict.fromkeys(IMPORT_STAGES, 0.0))
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] += time.perf_counter() - started
+
+    def report_stages(self) -> None:
+        for name, seconds in self.stages.items():
+            observe_import_stage(name, seconds)
+
+    def as_dict(self) -> dict:
+        elapsed = self.elapsed
+        return {
+            "imported": self.imported,
+            "changed": self.changed,
+            "unchanged": self.unchanged,
+            "products_created": self.products_created,
+            "rows": self.rows_read,
+            "rejected": self.rejected,
+            "rejected_rows": self.rejected_rows,
+            "chunks": self.chunks,
+            "days_refreshed": self.days_refreshed,
+            "statements": self.statements,
+            "elapsed_sec": round(elapsed, 3),
+            "stages_sec": {name: round(seconds, 3) for name, seconds in self.stages.items()},
+            "rows_per_sec": round(self.rows_read / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+
+
+def _save_state(db: AsyncSession, state: Optional[SyncState], user_id: int, csv_url: str) -> SyncState:
+    if state is None:
+        state = SyncState(user_id=user_id)
+        db.add(state)
+    if state.source_url != csv_url:
+        # Другая таблица - прежние отметки к ней не относятся
+        state.source_url = csv_url
+        state.last_order_date = None
+        state.etag = None
+        state.last_modified = None
+    state.last_synced_at = datetime.utcnow()
+    return state
+
+
+def read_csv_chunks(source, chunk_rows: int = None):
+    """Читает выгрузку кусками: только колонки из COLUMN_MAP и всё как строки (чистим сами)."""
+    return pd.read_csv(
+        source,
+        usecols=lambda col: col in COLUMN_MAP,
+        dtype=str,
+        keep_default_na=False,
+        encoding='utf-8-sig',
+        chunksize=chunk_rows or settings.IMPORT_CHUNK_ROWS,
+    )
+
+
+def order_months(source) -> set:
+    """Месяцы заказов в выгрузке: проход только по колонке даты, потом файл - снова в начало."""
+    date_column = next(name for name, field_name in COLUMN_MAP.items() if field_name == 'order_date')
+    months = set()
+    reader = pd.read_csv(
+        source,
+        usecols=lambda col: col == date_column,
+        dtype=str,
+        keep_default_na=False,
+        encoding='utf-8-sig',
+        chunksize=settings.IMPORT_CHUNK_ROWS,
+    )
+    for chunk in reader:
+        if date_column in chunk:
+            dates = parse_dates(chunk[date_column]).dropna()
+            months.update(d.date() for d in dates.dt.to_period('M').dt.start_time.unique())
+    source.seek(0)
+    return months
+
+
+def _next_cleaned(reader):
+    # Разбор и чистка куска - CPU; вызывается в потоке, чтобы не держать event loop
+    started = time.perf_counter()
+    raw = next(reader, None)
+    parsed = time.perf_counter()
+    if raw is None:
+        return None
+    cleaned = normalize_orders(raw.rename(columns=COLUMN_MAP))
+    return len(raw), cleaned, parsed - started, time.perf_counter() - parsed
+
+
+async def sync_kaspi_data(
+    csv_url: str,
+    user_id: int,
+    db: AsyncSession,
+    on_progress: Optional[Callable[[ImportStats], None]] = None,
+    conditional: bool = False,
+):
+    """conditional=True (автосинк): если таблица не менялась с прошлого раза (ETag / Last-Modified),
+    не скачиваем и не разбираем ее."""
+    stats = ImportStats()
+    writer = _BulkWriter(db, user_id)
+    on_postgres = writer.bind is not None and partitions.supported(writer.bind)
+
+    # Второй синк того же пользователя (другой воркер) сразу отказывает, а не ждет первый
+    # под statement_timeout. Блокировку держит вся транзакция импорта - берем ее до скачивания
+    if on_postgres and not await db.scalar(select(func.pg_try_advisory_xact_lock(SYNC_LOCK_CLASS, user_id))):
+        await db.rollback()
+        return {"error": "Синхронизация уже идет, попробуйте позже"}
+
+    state = await db.get(SyncState, user_id)
+    same_source = state is not None and state.source_url == csv_url
+
+    # Кусок читаем -> чистим -> пишем, и только потом читаем следующий:
+    # память не растет с размером файла. Всё в одной транзакции.
+    download = None
+    try:
+        with stats.stage("download"):
+            if conditional and same_source:
+                download = await download_csv(csv_url, etag=state.etag, last_modified=state.last_modified)
+            else:
+                download = await download_csv(csv_url)
+        if download.not_modified:
+            _save_state(db, state, user_id, csv_url)
+            await db.commit()
+            return {"status": "not_modified"}
+
+        last_order_date = None
+
+        # Секции под месяцы выгрузки - пока транзакция импорта не тронула orders (иначе CREATE ...
+        # PARTITION OF ждал бы ее самой). Этап "parse": это проход по файлу
+        if on_postgres:
+            with stats.stage("parse"):
+                months = await asyncio.to_thread(order_months, download.file)
+            await partitions.ensure_months(writer.bind, months)
+
+        reader = await asyncio.to_thread(read_csv_chunks, download.file)
+        while True:
+            chunk = await asyncio.to_thread(_next_cleaned, reader)
+            if chunk is None:
+                break
+            raw_rows, cleaned, parse_sec, clean_sec = chunk
+            stats.stages["parse"] += parse_sec
+            stats.stages["clean"] += clean_sec
+            df = cleaned.frame
+
+            if not df.empty:
+                chunk_max = df['order_date'].max().to_pydatetime()
+                last_order_date = max(last_order_date, chunk_max) if last_order_date else chunk_max
+
+            with stats.stage("write"):
+                stats.products_created += await writer.write_products(df)
+                counts = await writer.write_orders(df)
+            stats.imported += counts.new
+            stats.changed += counts.changed
+            stats.unchanged += counts.unchanged
+
+            stats.chunks += 1
+            stats.rows_read += raw_rows
+            stats.rejected += len({r["row"] for r in cleaned.rejected})
+            room = REJECTED_SAMPLE_SIZE - len(stats.rejected_rows)
+            if room > 0:
+                stats.rejected_rows.extend(cleaned.rejected[:room])
+            stats.statements = writer.statements
+
+            logger.info(
+                "sync user=%s chunk=%s rows=%s new=%s changed=%s unchanged=%s rejected=%s",
+                user_id, stats.chunks, stats.rows_read, stats.imported, stats.changed,
+                stats.unchanged, stats.rejected,
             )
-            db.add(new_order)
-            imported_count += 1
-    
-    await db.commit()
-    return {"status": "success", "imported": imported_count}
\ No newline at end of file
+            if on_progress:
+                on_progress(stats)
+    except (OSError, ValueError, pd.errors.ParserError) as e:
+        await db.rollback()
+        return {"error": f"Не удалось скачать файл: {str(e)}"}
+    finally:
+        if download is not None:
+            download.close()
+
+    # Итоги по дням - только за затронутые дни, в той же транзакции
+    with stats.stage("write"):
+        stats.days_refreshed = await refresh_days(db, user_id, writer.touched_days)
+        state = _save_state(db, state, user_id, csv_url)
+        if last_order_date is not None and (state.last_order_date is None or last_order_date > state.last_order_date):
+            state.last_order_date = last_order_date
+        state.etag = download.etag
+        state.last_modified = download.last_modified
+        await db.commit()
+    stats.report_stages()
+    await dashboard_cache.invalidate(user_id)
+    # Массивы для "что если" (если пользователь их уже грузил): новые заказы дочитываем,
+    # а после изменений старых - выбрасываем, перечитаются при следующем расчете
+    if stats.changed:
+        columnar_store.forget(user_id)
+    else:
+        await columnar_store.refresh(db, user_id)
+    return {"status": "success", **stats.as_dict()}
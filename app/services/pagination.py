@@ -0,0 +1,42 @@
+import base64
+import json
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.core.sql import explain
+
+
+def encode_cursor(last_id: int) -> str:
+    # Клиенту курсор непрозрачен: base64 от {"id": ...}
+    raw = json.dumps({"id": last_id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[int]:
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return int(json.loads(base64.urlsafe_b64decode(padded))["id"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def exact_count(db: AsyncSession, query) -> int:
+    result = await db.execute(select(func.count()).select_from(query.order_by(None).subquery()))
+    return result.scalar_one()
+
+
+async def estimated_count(db: AsyncSession, query) -> int:
+    """Оценка числа строк из планировщика Postgres (EXPLAIN без выполнения) вместо COUNT(*)."""
+    if db.bind.dialect.name != "postgresql":
+        return await exact_count(db, query)
+    result = await db.execute(explain(query.order_by(None)))
+    plan = result.scalar_one()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
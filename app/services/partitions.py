@@ -0,0 +1,161 @@
+"""Помесячные секции таблицы orders (Postgres).
+
+orders секционирована по order_date (RANGE, месяц = секция orders_yYYYYmMM) плюс секция
+orders_default для дат вне созданных секций. Секции создаются заранее (на N месяцев вперед
+при старте и командой cli) и импортом - для месяцев из выгрузки, ДО того как его транзакция
+тронет orders: CREATE ... PARTITION OF ждет ACCESS EXCLUSIVE на orders и встал бы за ней же.
+Если строки месяца уже лежат в orders_default (секцию не успели создать), они переносятся в новую
+секцию - иначе Postgres не даст ее создать.
+На SQLite все функции ничего не делают: там orders - обычная таблица.
+"""
+import logging
+import re
+import time
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+PARENT = "orders"
+DEFAULT_PARTITION = "orders_default"
+_NAME = re.compile(r"^orders_y(\d{4})m(\d{2})$")
+
+# Секции, про которые процесс уже знает, - чтобы не ходить в каталог на каждый кусок импорта
+_known: Set[date] = set()
+# Месяц -> time.monotonic(), раньше которого секцию не пробуем снова (не дождались блокировки)
+_retry_after: Dict[date, float] = {}
+
+
+def month_start(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+
+def add_months(d: date, months: int) -> date:
+    index = d.year * 12 + d.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT}_y{month.year:04d}m{month.month:02d}"
+
+
+def partition_month(name: str) -> Optional[date]:
+    match = _NAME.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def create_partition_sql(month: date) -> str:
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {PARENT} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    )
+
+
+async def _create_partition(conn, month: date) -> None:
+    # order_date - timestamp: границы передаем datetime, а не date (asyncpg не приводит сам)
+    end = add_months(month, 1)
+    bounds = {"start": datetime(month.year, month.month, 1), "end": datetime(end.year, end.month, 1)}
+    stray = await conn.scalar(text(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE order_date >= :start AND order_date < :end)"
+    ), bounds)
+    if not stray:
+        await conn.execute(text(create_partition_sql(month)))
+        return
+    # Пока orders_default отсоединена, новая секция создается без проверки ее строк;
+    # строки месяца переезжаем в секцию, при обратном ATTACH Postgres сверит остаток
+    name = partition_name(month)
+    await conn.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {DEFAULT_PARTITION}"))
+    await conn.execute(text(create_partition_sql(month)))
+    moved = await conn.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE order_date >= :start AND order_date < :end "
+        f"RETURNING *) INSERT INTO {name} SELECT * FROM moved"
+    ), bounds)
+    await conn.execute(text(f"ALTER TABLE {PARENT} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+    logger.info("orders partition %s: %s rows moved from %s", name, moved.rowcount, DEFAULT_PARTITION)
+
+
+def supported(engine: AsyncEngine) -> bool:
+    return engine.dialect.name == "postgresql"
+
+
+async def list_partitions(engine: AsyncEngine) -> List[str]:
+    if not supported(engine):
+        return []
+    async with engine.connect() as conn:
+        result = await conn.execute(text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = CAST(:parent AS regclass) ORDER BY c.relname"
+        ), {"parent": PARENT})
+        return list(result.scalars())
+
+
+async def ensure_months(engine: AsyncEngine, months: Iterable[date]) -> List[str]:
+    """Создает недостающие секции, каждую своей короткой транзакцией с lock_timeout.
+    Вызывать нельзя из-под транзакции, которая уже читала или писала orders: CREATE ... PARTITION OF
+    ждет ее завершения. Не дождались блокировки - секцию не создаем, строки лягут в orders_default
+    и переедут при следующей попытке (не раньше ORDERS_PARTITION_RETRY_SECONDS)."""
+    if not supported(engine):
+        return []
+    missing = sorted({month_start(m) for m in months} - _known)
+    if not missing:
+        return []
+
+    existing = {partition_month(name) for name in await list_partitions(engine)}
+    created = []
+    now = time.monotonic()
+    for month in missing:
+        if month in existing:
+            _known.add(month)
+            continue
+        if _retry_after.get(month, 0.0) > now:
+            continue
+        try:
+            async with engine.begin() as conn:
+                await conn.execute(text(f"SET LOCAL lock_timeout = {int(settings.ORDERS_PARTITION_LOCK_TIMEOUT_MS)}"))
+                await _create_partition(conn, month)
+        except DBAPIError as e:
+            # Иначе каждый синк с этим месяцем снова вставал бы в очередь за ACCESS EXCLUSIVE
+            _retry_after[month] = now + settings.ORDERS_PARTITION_RETRY_SECONDS
+            logger.warning("orders partition %s not created: %s", partition_name(month), e.orig)
+            continue
+        _retry_after.pop(month, None)
+        _known.add(month)
+        created.append(partition_name(month))
+    if created:
+        logger.info("orders partitions created: %s", ", ".join(created))
+    return created
+
+
+async def ensure_future(engine: AsyncEngine, months_ahead: int = None, today: date = None) -> List[str]:
+    """Текущий месяц и months_ahead следующих."""
+    months_ahead = settings.ORDERS_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    current = month_start(today or date.today())
+    return await ensure_months(engine, [add_months(current, n) for n in range(months_ahead + 1)])
+
+
+async def detach_before(engine: AsyncEngine, before: date, archive_schema: str = None, drop: bool = False) -> List[str]:
+    """Отсоединяет секции целиком старше месяца before. Дальше: оставить отдельной таблицей,
+    перенести в archive_schema или удалить (drop). daily_stats за эти дни остаются."""
+    if not supported(engine):
+        return []
+    old = [
+        name for name in await list_partitions(engine)
+        if partition_month(name) is not None and partition_month(name) < month_start(before)
+    ]
+    async with engine.begin() as conn:
+        if archive_schema:
+            await conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{archive_schema}"'))
+        for name in old:
+            await conn.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {name}"))
+            if drop:
+                await conn.execute(text(f"DROP TABLE {name}"))
+            elif archive_schema:
+                await conn.execute(text(f'ALTER TABLE {name} SET SCHEMA "{archive_schema}"'))
+    _known.difference_update(partition_month(name) for name in old)
+    return old
@@ -0,0 +1,95 @@
+import io
+from typing import Dict, List, Tuple
+
+import pandas as pd
+from pydantic import ValidationError
+from sqlalchemy import Float, String, cast, column, func, update, values
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Product
+from app.schemas import ProductBulkItem, ProductBulkResult, ProductUpdate
+from app.services.cleaning import parse_numbers
+
+# Поля себестоимости, которые можно менять (те же, что в PATCH /products/{sku})
+COST_FIELDS = list(ProductUpdate.model_fields)
+
+# Строк в одном UPDATE ... FROM (VALUES ...): (1 + поля) * строки < 32767 параметров asyncpg
+ROWS_PER_STATEMENT = 2000
+
+
+def validate_items(raw_items: List[dict]) -> Tuple[Dict[str, ProductBulkItem], List[ProductBulkResult]]:
+    """Каждую строку проверяем через ProductUpdate отдельно: одна кривая строка не валит весь файл.
+    Повторный SKU - побеждает последняя строка."""
+    items: Dict[str, ProductBulkItem] = {}
+    invalid = []
+    for raw in raw_items:
+        sku = str(raw.get("sku", "")).strip() if isinstance(raw, dict) else ""
+        try:
+            item = ProductBulkItem.model_validate({**raw, "sku": sku})
+        except (ValidationError, TypeError) as e:
+            error = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()) \
+                if isinstance(e, ValidationError) else str(e)
+            invalid.append(ProductBulkResult(sku=sku, status="invalid", error=error))
+            continue
+        if not sku:
+            invalid.append(ProductBulkResult(sku=sku, status="invalid", error="sku: пустой артикул"))
+            continue
+        items[sku] = item
+    return items, invalid
+
+
+def parse_costs_csv(content: bytes) -> Tuple[List[dict], List[ProductBulkResult]]:
+    """CSV "sku;purchase_price;..." (разделитель , или ;) -> строки для validate_items.
+    Числа в формате Каспи/Excel ("1 500,50") разбираем тем же кодом, что и импорт."""
+    df = pd.read_csv(
+        io.BytesIO(content), sep=None, engine="python", dtype=str,
+        keep_default_na=False, encoding="utf-8-sig",
+    )
+    df.columns = [c.strip() for c in df.columns]
+    if "sku" not in df.columns:
+        raise ValueError("В файле нет колонки sku")
+
+    cost_cols = [c for c in COST_FIELDS if c in df.columns]
+    rows = [{"sku": sku} for sku in df["sku"]]
+    bad = pd.Series(False, index=df.index)
+    for col in cost_cols:
+        parsed = parse_numbers(df[col])
+        blank = df[col].str.strip() == ""
+        bad |= parsed.isna() & ~blank
+        for row, value, is_blank in zip(rows, parsed, blank):
+            if not is_blank:
+                row[col] = value
+
+    invalid = [
+        ProductBulkResult(sku=str(df.at[idx, "sku"]).strip(), status="invalid", error=f"строка {idx + 2}: не число")
+        for idx in df.index[bad]
+    ]
+    rows = [row for row, is_bad in zip(rows, bad) if not is_bad]
+    return rows, invalid
+
+
+async def apply_cost_updates(db: AsyncSession, user_id: int, items: Dict[str, ProductBulkItem]) -> set:
+    """Один UPDATE products ... FROM (VALUES ...) на пачку. Не присланные поля не трогаем (NULL -> COALESCE).
+    Возвращает SKU, которые нашлись и обновились. Коммит - на вызывающем."""
+    updated = set()
+    rows = [
+        (sku, *(getattr(item, f) for f in COST_FIELDS))
+        for sku, item in items.items()
+    ]
+    for start in range(0, len(rows), ROWS_PER_STATEMENT):
+        v = values(
+            column("sku", String),
+            *(column(f, Float) for f in COST_FIELDS),
+            name="v",
+        ).data(rows[start:start + ROWS_PER_STATEMENT])
+
+        stmt = (
+            update(Product)
+            .where(Product.user_id == user_id, Product.sku == v.c.sku)
+            # cast: если во всей пачке поле пустое, Postgres сочтет колонку VALUES текстом
+            .values({f: func.coalesce(cast(v.c[f], Float), getattr(Product, f)) for f in COST_FIELDS})
+            .returning(Product.sku)
+        )
+        result = await db.execute(stmt)
+        updated.update(result.scalars().all())
+    return updated
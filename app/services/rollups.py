@@ -0,0 +1,105 @@
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, case, delete, func, literal, true
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.core.sql import day_of, dialect_insert
+from app.models import DailyStat, Order
+from app.services.stats import daily_stats_query, get_tax_percent
+
+# Сколько дней (или SKU) отправляем в один запрос
+KEYS_PER_STATEMENT = 500
+
+_ROLLUP_COLUMNS = ["user_id", "day", "revenue", "profit", "orders_count", "without_costs"]
+
+
+def _rollup_insert(db: AsyncSession, user_id: int, tax_percent: float, start: datetime = None, end: datetime = None,
+                   days: List[date] = None):
+    # INSERT INTO daily_stats SELECT ... GROUP BY day - данные не выходят из базы.
+    # ON CONFLICT DO UPDATE: параллельный пересчет тех же дней (синк и правка себестоимости) вставил
+    # строку после нашего DELETE - перезаписываем ее, а не падаем на первичном ключе
+    query = daily_stats_query(user_id, tax_percent, start, end)
+    if days is not None:
+        query = query.where(day_of(Order.order_date).in_(days))
+    agg = query.order_by(None).subquery()
+    stmt = dialect_insert(db.bind.dialect.name)(DailyStat).from_select(
+        _ROLLUP_COLUMNS,
+        select(
+            literal(user_id),
+            day_of(agg.c.day),
+            agg.c.revenue,
+            agg.c.profit,
+            agg.c.orders_count,
+            agg.c.without_costs,
+        # WHERE true: без него SQLite принимает ON CONFLICT за условие JOIN
+        ).where(true()),
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=["user_id", "day"],
+        set_={name: stmt.excluded[name] for name in _ROLLUP_COLUMNS[2:]},
+    )
+
+
+async def refresh_days(db: AsyncSession, user_id: int, days: Iterable[date]) -> int:
+    """Пересчитывает итоги только за указанные дни. Коммит - на вызывающем."""
+    days = sorted(set(days))
+    if not days:
+        return 0
+
+    tax_percent = await get_tax_percent(db, user_id)
+    for start in range(0, len(days), KEYS_PER_STATEMENT):
+        chunk = days[start:start + KEYS_PER_STATEMENT]
+        await db.execute(
+            delete(DailyStat).where(DailyStat.user_id == user_id, DailyStat.day.in_(chunk))
+        )
+        # Диапазон дат - чтобы работал индекс по order_date, список дней - чтобы не трогать лишнее
+        range_start = datetime.combine(chunk[0], datetime.min.time())
+        range_end = datetime.combine(chunk[-1], datetime.min.time()) + timedelta(days=1)
+        await db.execute(_rollup_insert(db, user_id, tax_percent, range_start, range_end, chunk))
+    return len(days)
+
+
+async def refresh_sku_days(db: AsyncSession, user_id: int, skus: List[str]) -> int:
+    """Себестоимость товаров поменялась - пересчитываем дни, где они продавались."""
+    days = set()
+    for start in range(0, len(skus), KEYS_PER_STATEMENT):
+        result = await db.execute(
+            select(day_of(Order.order_date)).distinct()
+            .where(Order.user_id == user_id, Order.sku.in_(skus[start:start + KEYS_PER_STATEMENT]))
+        )
+        days.update(result.scalars().all())
+    return await refresh_days(db, user_id, days)
+
+
+async def rebuild_user(db: AsyncSession, user_id: int) -> None:
+    """Полный пересчет итогов пользователя (бэкфилл, смена налога)."""
+    tax_percent = await get_tax_percent(db, user_id)
+    await db.execute(delete(DailyStat).where(DailyStat.user_id == user_id))
+    await db.execute(_rollup_insert(db, user_id, tax_percent))
+
+
+def dashboard_rows_query(user_id: int, start_day: date):
+    # Дашборд читает не больше одной строки на день окна
+    return (
+        select(DailyStat)
+        .where(DailyStat.user_id == user_id, DailyStat.day >= start_day)
+        .order_by(DailyStat.day)
+    )
+
+
+def period_totals_query(user_id: int, periods: Dict[str, Tuple[date, Optional[date]]]):
+    """Итоги нескольких периодов за один проход по daily_stats: SUM(CASE WHEN day в периоде ...).
+    periods: имя -> (первый день, день после последнего или None). Колонки: <имя>_revenue/_profit/_orders."""
+    columns = []
+    for name, (start, end) in periods.items():
+        inside = DailyStat.day >= start if end is None else and_(DailyStat.day >= start, DailyStat.day < end)
+        columns += [
+            func.sum(case((inside, DailyStat.revenue), else_=0.0)).label(f"{name}_revenue"),
+            func.sum(case((inside, DailyStat.profit), else_=0.0)).label(f"{name}_profit"),
+            func.sum(case((inside, DailyStat.orders_count), else_=0)).label(f"{name}_orders"),
+        ]
+    # Читаем только самый широкий диапазон
+    first = min(start for start, _ in periods.values())
+    return select(*columns).where(DailyStat.user_id == user_id, DailyStat.day >= first)
@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from sqlalchemy import func, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.future import select
+
+from app.config import settings
+from app.database import AsyncSessionLocal, engine
+from app.models import CompanySettings, User
+from app.services.sync_jobs import FAILED, SyncJob, SyncJobManager, sync_jobs
+
+logger = logging.getLogger(__name__)
+
+# Ключ pg_advisory_lock: автосинк ведет один процесс на всю базу
+SCHEDULER_LOCK_KEY = 7302
+
+
+@dataclass
+class TenantSchedule:
+    next_run: float = 0.0       # time.monotonic(), 0 - при первой проверке
+    failures: int = 0           # Ошибок подряд
+    job: Optional[SyncJob] = None
+
+
+class SyncScheduler:
+    """Периодический синк всех пользователей с google_sheet_url.
+
+    Интервал с разбросом (jitter), чтобы синки не шли пачкой; после ошибок подряд
+    пауза растет экспоненциально до max_backoff. Одновременно в очереди не больше
+    max_concurrency автосинков; это меньше, чем слотов в очереди синков, так что ручному
+    POST /sync всегда остается место.
+
+    Планировщик запущен в каждом воркере, но синкает только лидер - процесс, который держит
+    pg_advisory_lock на отдельном соединении. Соединение оборвалось - лидером станет другой.
+    """
+
+    def __init__(
+        self,
+        jobs: SyncJobManager,
+        interval: float,
+        jitter: float,
+        max_backoff: float,
+        tick: float,
+        max_concurrency: int,
+    ):
+        self.jobs = jobs
+        self.interval = interval
+        self.jitter = jitter
+        self.max_backoff = max_backoff
+        self.tick_seconds = tick
+        self.max_concurrency = max_concurrency
+        self._tenants: Dict[int, TenantSchedule] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._leader_conn: Optional[AsyncConnection] = None
+
+    def _delay(self, failures: int) -> float:
+        base = self.interval if failures == 0 else min(self.interval * 2 ** failures, self.max_backoff)
+        return base * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _collect_finished(self, now: float) -> None:
+        for user_id, tenant in self._tenants.items():
+            job = tenant.job
+            if job is None or job.active:
+                continue
+            tenant.job = None
+            tenant.failures = tenant.failures + 1 if job.status == FAILED else 0
+            tenant.next_run = now + self._delay(tenant.failures)
+            if job.status == FAILED:
+                logger.warning("auto sync user=%s failed (%s in a row): %s", user_id, tenant.failures, job.error)
+
+    async def _sheet_urls(self) -> Dict[int, str]:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(CompanySettings.user_id, CompanySettings.google_sheet_url)
+                .join(User, User.id == CompanySettings.user_id)
+                .where(CompanySettings.google_sheet_url.is_not(None), CompanySettings.google_sheet_url != "", User.is_active)
+            )
+            return dict(result.all())
+
+    async def _is_leader(self) -> bool:
+        if engine.dialect.name != "postgresql":
+            return True  # SQLite - локальный прогон в одном процессе
+        if self._leader_conn is not None:
+            try:
+                await self._leader_conn.execute(text("SELECT 1"))
+                await self._leader_conn.commit()
+                return True
+            except Exception:
+                logger.warning("auto sync leader connection lost")
+                await self._release_leadership()
+        conn = await engine.connect()
+        try:
+            # Блокировка уровня сессии: переживает commit, держится, пока живо соединение
+            acquired = await conn.scalar(select(func.pg_try_advisory_lock(SCHEDULER_LOCK_KEY)))
+            await conn.commit()
+        except Exception:
+            await conn.close()
+            raise
+        if not acquired:
+            await conn.close()
+            return False
+        logger.info("auto sync: this process is the leader")
+        self._leader_conn = conn
+        return True
+
+    async def _release_leadership(self) -> None:
+        conn, self._leader_conn = self._leader_conn, None
+        if conn is None:
+            return
+        try:
+            await conn.execute(select(func.pg_advisory_unlock(SCHEDULER_LOCK_KEY)))
+            await conn.commit()
+            await conn.close()
+        except Exception:
+            # Не вернули блокировку - соединение в пул не отдаем, закрываем совсем
+            await conn.invalidate()
+
+    async def run_once(self) -> int:
+        """Одна проверка: ставит в очередь тех, кому пора. Возвращает число новых задач."""
+        now = time.monotonic()
+        if not await self._is_leader():
+            return 0
+        self._collect_finished(now)
+        urls = await self._sheet_urls()
+
+        # Ссылку убрали - забываем пользователя
+        for user_id in set(self._tenants) - set(urls):
+            if self._tenants[user_id].job is None:
+                del self._tenants[user_id]
+
+        in_flight = sum(1 for t in self._tenants.values() if t.job is not None)
+        due = [
+            user_id for user_id in urls
+            if self._tenants.setdefault(user_id, TenantSchedule()).job is None
+            and self._tenants[user_id].next_run <= now
+        ]
+        due.sort(key=lambda user_id: self._tenants[user_id].next_run)
+
+        submitted = 0
+        for user_id in due[:max(self.max_concurrency - in_flight, 0)]:
+            self._tenants[user_id].job = self.jobs.submit(user_id, urls[user_id], conditional=True)
+            submitted += 1
+        return submitted
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("auto sync tick failed")
+            await asyncio.sleep(self.tick_seconds)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self._release_leadership()
+
+
+sync_scheduler = SyncScheduler(
+    sync_jobs,
+    interval=settings.AUTO_SYNC_INTERVAL_SECONDS,
+    jitter=settings.AUTO_SYNC_JITTER,
+    max_backoff=settings.AUTO_SYNC_MAX_BACKOFF_SECONDS,
+    tick=settings.AUTO_SYNC_TICK_SECONDS,
+    # Хотя бы один слот очереди синков - под ручные POST /sync (при SYNC_MAX_CONCURRENCY >= 2)
+    max_concurrency=max(1, min(settings.AUTO_SYNC_MAX_CONCURRENCY, settings.SYNC_MAX_CONCURRENCY - 1)),
+)
@@ -0,0 +1,256 @@
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Any, Iterable, Optional
+
+from sqlalchemy import and_, case, func, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.core.sql import day_start
+from app.models import CompanySettings, Order, Product
+from app.schemas import DashboardStats, DailyStats, PeriodDelta, PeriodTotals
+
+# Эти заказы не считаем ни в выручку, ни в прибыль
+EXCLUDED_STATUSES = ("Отменен", "Возврат")
+
+# Налог, если пользователь еще не заполнил настройки
+DEFAULT_TAX_PERCENT = 3.0
+
+
+async def get_tax_percent(db: AsyncSession, user_id: int) -> float:
+    result = await db.execute(select(CompanySettings.tax_percent).where(CompanySettings.user_id == user_id))
+    tax_percent = result.scalar_one_or_none()
+    return tax_percent if tax_percent is not None else DEFAULT_TAX_PERCENT
+
+
+def counted_orders():
+    return or_(Order.status.is_(None), Order.status.not_in(EXCLUDED_STATUSES))
+
+
+def tenant_product_join():
+    # Товар ищем только у того же пользователя: одинаковые SKU у разных продавцов не смешиваются
+    return and_(Product.user_id == Order.user_id, Product.sku == Order.sku)
+
+
+@dataclass
+class LineCosts:
+    """Составляющие прибыли по одной строке заказа (SQL-выражения)."""
+    qty: Any
+    cogs: Any           # Себестоимость * Кол-во
+    commission: Any
+    tax: Any
+    delivery: Any
+    profit: Any
+
+
+def line_costs(tax_percent: float) -> LineCosts:
+    """Та же формула, что была в цикле get_dashboard_stats.
+
+    Прибыль = Выручка - (Себестоимость*Кол-во + Комиссия) - Налог - ДоставкаКаспи
+    Порядок операций сохранен, чтобы float-результат совпадал с Python-версией.
+    """
+    revenue = Order.amount
+    qty = case((Order.quantity > 0, Order.quantity), else_=1)
+
+    # Расходы на ОДНУ штуку уже посчитаны в products.unit_cost (товара может не быть - тогда 0)
+    cogs = func.coalesce(Product.unit_cost, 0.0) * qty
+    commission = revenue * (func.coalesce(Product.kaspi_commission, 0.0) / 100.0)
+    total_cogs = cogs + commission
+
+    tax_amount = revenue * (tax_percent / 100)
+    delivery_kaspi = func.coalesce(Order.delivery_cost_for_seller, 0.0)
+
+    return LineCosts(
+        qty=qty,
+        cogs=cogs,
+        commission=commission,
+        tax=tax_amount,
+        delivery=delivery_kaspi,
+        profit=revenue - total_cogs - tax_amount - delivery_kaspi,
+    )
+
+
+def line_profit(tax_percent: float):
+    return line_costs(tax_percent).profit
+
+
+def missing_costs():
+    # 1, если у строки нет товара или не заполнен закуп
+    return case((Product.has_costs.is_(True), 0), else_=1)
+
+
+def products_without_costs_query(user_id: int):
+    # Счет по индексу (user_id, has_costs), заказы не трогаем
+    return (
+        select(func.count())
+        .select_from(Product)
+        .where(Product.user_id == user_id, Product.has_costs.is_(False))
+    )
+
+
+def daily_stats_query(
+    user_id: int,
+    tax_percent: float,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+):
+    """Один GROUP BY по дням: наружу уходит по строке на день, а не по строке на заказ."""
+    day = day_start(Order.order_date).label("day")
+    query = (
+        select(
+            day,
+            func.sum(Order.amount).label("revenue"),
+            func.sum(line_profit(tax_percent)).label("profit"),
+            func.count().label("orders_count"),
+            func.sum(missing_costs()).label("without_costs"),
+        )
+        .select_from(Order)
+        .join(Product, tenant_product_join(), isouter=True)
+        .where(
+            Order.user_id == user_id,
+            counted_orders(),
+        )
+        .group_by(day)
+        .order_by(day)
+    )
+    if start_date is not None:
+        query = query.where(Order.order_date >= start_date)
+    if end_date is not None:
+        query = query.where(Order.order_date < end_date)
+    return query
+
+
+def build_dashboard(rows: Iterable, products_without_costs: int = 0) -> DashboardStats:
+    """Собирает DashboardStats из строк (day, revenue, profit, orders_count)."""
+    total_revenue = 0.0
+    total_profit = 0.0
+    total_orders = 0
+    chart_data = []
+
+    for row in rows:
+        revenue = row.revenue or 0.0
+        profit = row.profit or 0.0
+        total_revenue += revenue
+        total_profit += profit
+        total_orders += row.orders_count
+
+        day = row.day.date() if isinstance(row.day, datetime) else row.day
+        chart_data.append(DailyStats(
+            date=day,
+            revenue=round(revenue, 2),
+            profit=round(profit, 2),
+            orders_count=row.orders_count,
+        ))
+
+    margin = (total_profit / total_revenue * 100) if total_revenue > 0 else 0
+    total_expenses = total_revenue - total_profit
+    roi = (total_profit / total_expenses * 100) if total_expenses > 0 else 0
+
+    return DashboardStats(
+        total_revenue=round(total_revenue, 2),
+        total_profit=round(total_profit, 2),
+        total_orders=total_orders,
+        margin_percent=round(margin, 2),
+        roi_percent=round(roi, 2),
+        chart_data=chart_data,
+        products_without_costs=products_without_costs,
+    )
+
+
+def period_totals(start: date, end: date, revenue: Optional[float], profit: Optional[float], orders_count: Optional[int]) -> PeriodTotals:
+    """Карточки дашборда за период - те же формулы, что в build_dashboard."""
+    revenue = revenue or 0.0
+    profit = profit or 0.0
+    margin = (profit / revenue * 100) if revenue > 0 else 0
+    expenses = revenue - profit
+    roi = (profit / expenses * 100) if expenses > 0 else 0
+    return PeriodTotals(
+        start=start,
+        end=end,
+        revenue=round(revenue, 2),
+        profit=round(profit, 2),
+        orders_count=orders_count or 0,
+        margin_percent=round(margin, 2),
+        roi_percent=round(roi, 2),
+    )
+
+
+def _percent_change(current: float, previous: float) -> Optional[float]:
+    return round((current - previous) / abs(previous) * 100, 2) if previous else None
+
+
+def period_delta(current: PeriodTotals, previous: PeriodTotals) -> PeriodDelta:
+    return PeriodDelta(
+        revenue=round(current.revenue - previous.revenue, 2),
+        profit=round(current.profit - previous.profit, 2),
+        orders_count=current.orders_count - previous.orders_count,
+        margin_points=round(current.margin_percent - previous.margin_percent, 2),
+        revenue_percent=_percent_change(current.revenue, previous.revenue),
+        profit_percent=_percent_change(current.profit, previous.profit),
+        orders_percent=_percent_change(current.orders_count, previous.orders_count),
+    )
+
+
+def sku_report_query(
+    user_id: int,
+    tax_percent: float,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+):
+    """GROUP BY sku: по строке на товар, даже если заказов миллион."""
+    line = line_costs(tax_percent)
+    query = (
+        select(
+            Order.sku.label("sku"),
+            func.max(func.coalesce(Product.name, Order.product_name)).label("name"),
+            func.count().label("orders_count"),
+            func.sum(line.qty).label("units"),
+            func.sum(Order.amount).label("revenue"),
+            func.sum(line.cogs).label("cogs"),
+            func.sum(line.commission).label("commission"),
+            func.sum(line.tax).label("tax"),
+            func.sum(line.delivery).label("delivery"),
+            func.sum(line.profit).label("profit"),
+        )
+        .select_from(Order)
+        .join(Product, tenant_product_join(), isouter=True)
+        .where(
+            Order.user_id == user_id,
+            counted_orders(),
+        )
+        .group_by(Order.sku)
+    )
+    if start_date is not None:
+        query = query.where(Order.order_date >= start_date)
+    if end_date is not None:
+        query = query.where(Order.order_date < end_date)
+    return query
+
+
+def orders_export_query(user_id: int, tax_percent: float, start_date: Optional[datetime] = None):
+    """Заказы с расчетом прибыли построчно - для выгрузки. Отмены/возвраты тоже, с пометкой counted."""
+    line = line_costs(tax_percent)
+    query = (
+        select(
+            Order.kaspi_id,
+            Order.order_date,
+            Order.sku,
+            Order.product_name,
+            Order.status,
+            line.qty.label("quantity"),
+            Order.amount,
+            line.cogs.label("cogs"),
+            line.commission.label("commission"),
+            line.tax.label("tax"),
+            line.delivery.label("delivery"),
+            line.profit.label("profit"),
+            case((counted_orders(), 1), else_=0).label("counted"),
+        )
+        .select_from(Order)
+        .join(Product, tenant_product_join(), isouter=True)
+        .where(Order.user_id == user_id)
+        .order_by(Order.order_date, Order.id)
+    )
+    if start_date is not None:
+        query = query.where(Order.order_date >= start_date)
+    return query
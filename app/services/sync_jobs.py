@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Optional
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.services.importer import ImportStats, sync_kaspi_data
+
+logger = logging.getLogger(__name__)
+
+# Статусы задачи синхронизации
+QUEUED = "queued"
+RUNNING = "running"
+SUCCESS = "success"
+FAILED = "failed"
+
+
+@dataclass
+class SyncJob:
+    user_id: int
+    csv_url: str
+    conditional: bool = False   # Автосинк: не качать таблицу, если она не менялась
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = QUEUED
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+
+    # Прогресс (обновляется после каждого куска CSV)
+    rows_read: int = 0
+    imported: int = 0
+    changed: int = 0
+    unchanged: int = 0
+    skipped: int = 0
+    result: Optional[dict] = None
+    error: Optional[str] = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in (QUEUED, RUNNING)
+
+    @property
+    def elapsed_sec(self) -> float:
+        if self.started is None:
+            return 0.0
+        end = self.finished if self.finished is not None else time.perf_counter()
+        return round(end - self.started, 3)
+
+    def update(self, stats: ImportStats) -> None:
+        self.rows_read = stats.rows_read
+        self.imported = stats.imported
+        self.changed = stats.changed
+        self.unchanged = stats.unchanged
+        self.skipped = stats.rejected
+
+
+class SyncJobManager:
+    """Очередь синхронизаций внутри процесса: не больше max_concurrency импортов одновременно,
+    один активный импорт на пользователя (повторный POST /sync вернет уже идущую задачу)."""
+
+    def __init__(self, max_concurrency: int, job_ttl_seconds: int):
+        self.max_concurrency = max_concurrency
+        self.job_ttl_seconds = job_ttl_seconds
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._jobs: Dict[str, SyncJob] = {}
+        self._active_by_user: Dict[int, SyncJob] = {}
+        self._tasks = set()
+
+    def submit(self, user_id: int, csv_url: str, conditional: bool = False) -> SyncJob:
+        self._forget_finished()
+
+        job = self._active_by_user.get(user_id)
+        if job and job.active:
+            return job
+
+        job = SyncJob(user_id=user_id, csv_url=csv_url, conditional=conditional)
+        self._jobs[job.id] = job
+        self._active_by_user[user_id] = job
+
+        task = asyncio.create_task(self._run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def get(self, job_id: str) -> Optional[SyncJob]:
+        return self._jobs.get(job_id)
+
+    async def _run(self, job: SyncJob) -> None:
+        async with self._semaphore:
+            job.status = RUNNING
+            job.started = time.perf_counter()
+            try:
+                # Своя сессия: HTTP-запрос давно завершился и его сессия закрыта
+                async with AsyncSessionLocal() as db:
+                    result = await sync_kaspi_data(
+                        job.csv_url, job.user_id, db, on_progress=job.update, conditional=job.conditional,
+                    )
+                job.result = result
+                if "error" in result:
+                    job.status = FAILED
+                    job.error = result["error"]
+                else:
+                    job.status = SUCCESS
+            except Exception as e:
+                logger.exception("sync job %s failed", job.id)
+                job.status = FAILED
+                job.error = str(e)
+            finally:
+                job.finished = time.perf_counter()
+                if self._active_by_user.get(job.user_id) is job:
+                    del self._active_by_user[job.user_id]
+
+    def _forget_finished(self) -> None:
+        now = time.perf_counter()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished is not None and now - job.finished > self.job_ttl_seconds
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    async def shutdown(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+sync_jobs = SyncJobManager(
+    max_concurrency=settings.SYNC_MAX_CONCURRENCY,
+    job_ttl_seconds=settings.SYNC_JOB_TTL_SECONDS,
+)
@@ -0,0 +1,39 @@
+"""Сравнение двух прогонов: python -m benchmarks.compare old.json new.json"""
+import json
+import sys
+from pathlib import Path
+
+
+def _flatten(node, prefix=""):
+    if isinstance(node, dict):
+        for key, value in node.items():
+            yield from _flatten(value, f"{prefix}.{key}" if prefix else key)
+    elif isinstance(node, (int, float)) and not isinstance(node, bool):
+        yield prefix, node
+
+
+def compare(old: dict, new: dict) -> list:
+    # Сравниваем только сводные числа (tenants - по одному пользователю, это шум)
+    old_flat = {k: v for k, v in _flatten(old["scenarios"]) if ".tenants" not in k}
+    new_flat = {k: v for k, v in _flatten(new["scenarios"]) if ".tenants" not in k}
+    rows = []
+    for key in sorted(old_flat.keys() & new_flat.keys()):
+        before, after = old_flat[key], new_flat[key]
+        delta = (after - before) / before * 100 if before else 0.0
+        rows.append((key, before, after, delta))
+    return rows
+
+
+def main() -> None:
+    if len(sys.argv) != 3:
+        sys.exit("usage: python -m benchmarks.compare OLD.json NEW.json")
+    old, new = (json.loads(Path(p).read_text(encoding="utf-8")) for p in sys.argv[1:])
+    if old["meta"]["params"] != new["meta"]["params"]:
+        print("warning: прогоны с разными параметрами", file=sys.stderr)
+    print(f"{old['meta'].get('commit', '')[:8]} -> {new['meta'].get('commit', '')[:8]}")
+    for key, before, after, delta in compare(old, new):
+        print(f"{key:60} {before:>12} {after:>12} {delta:+8.1f}%")
+
+
+if __name__ == "__main__":
+    main()
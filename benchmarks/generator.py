@@ -0,0 +1,104 @@
+"""Генератор выгрузок Каспи: те же русские заголовки, NBSP в суммах, разные статусы и немного мусора."""
+import csv
+import random
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+
+from app.services.importer import COLUMN_MAP
+
+HEADERS = list(COLUMN_MAP)  # '№ заказа', 'Артикул', ...
+
+# Статус -> вес. Отмены и возвраты важны: они не входят в выручку
+STATUSES = {
+    "Выдан": 80,
+    "Новый": 6,
+    "Ожидает передачи курьеру": 4,
+    "Отменен": 7,
+    "Возврат": 3,
+}
+
+
+@dataclass
+class TenantExport:
+    tenant: int
+    path: Path
+    orders: int
+    skus: List[str] = field(default_factory=list)
+
+
+def _money(value: float, rng: random.Random) -> str:
+    # "12 500" / "12 500,50": разделитель тысяч - NBSP, дробная часть через запятую
+    whole, cents = divmod(round(value * 100), 100)
+    text = f"{whole:,}".replace(",", " ")
+    if cents and rng.random() < 0.5:
+        text += f",{cents:02d}"
+    return text
+
+
+def generate_tenant(
+    tenant: int,
+    out_dir: Path,
+    skus: int,
+    orders: int,
+    days: int = 365,
+    seed: int = 42,
+    junk_ratio: float = 0.001,
+    now: datetime = None,
+) -> TenantExport:
+    """Одна выгрузка: orders заказов по skus товарам за последние days дней."""
+    rng = random.Random(f"{seed}:{tenant}")
+    now = now or datetime(2026, 1, 1)
+    sku_list = [f"T{tenant}-{n:05d}" for n in range(skus)]
+    prices = {sku: rng.uniform(1_000, 150_000) for sku in sku_list}
+    # Немного хитов и длинный хвост - как в реальных магазинах
+    weights = [1.0 / (rank + 1) for rank in range(skus)]
+    statuses, status_weights = zip(*STATUSES.items())
+
+    path = out_dir / f"tenant_{tenant}.csv"
+    with path.open("w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADERS)
+        for n in range(orders):
+            sku = rng.choices(sku_list, weights)[0]
+            qty = rng.choices((1, 2, 3), (85, 10, 5))[0]
+            order_date = now - timedelta(days=rng.random() * days)
+            row = {
+                "№ заказа": f"{tenant}{n:09d}",
+                "Артикул": sku,
+                "Сумма": _money(prices[sku] * qty, rng),
+                "Статус": rng.choices(statuses, status_weights)[0],
+                "Дата поступления заказа": order_date.strftime("%d.%m.%Y %H:%M"),
+                "Стоимость доставки для продавца": _money(rng.choice((0, 0, 990, 1490, 2500)), rng),
+                "Название товара в Kaspi Магазине": f"Товар {sku}",
+                "Количество": str(qty),
+            }
+            if rng.random() < junk_ratio:
+                row[rng.choice(("Сумма", "Дата поступления заказа"))] = "н/д"
+            writer.writerow([row[h] for h in HEADERS])
+    return TenantExport(tenant=tenant, path=path, orders=orders, skus=sku_list)
+
+
+def mutate(export: TenantExport, ratio: float = 0.05, seed: int = 42) -> TenantExport:
+    """Та же выгрузка, где у доли заказов сменились статус (отмена/возврат) и сумма - повторный синк
+    с изменениями идет через массовый UPDATE, а не только через сверку отпечатков."""
+    rng = random.Random(f"{seed}:{export.tenant}:changed")
+    path = export.path.with_name(f"{export.path.stem}_changed.csv")
+    changed = 0
+    with export.path.open(encoding="utf-8", newline="") as src, path.open("w", encoding="utf-8", newline="") as dst:
+        reader, writer = csv.reader(src), csv.writer(dst)
+        writer.writerow(next(reader))
+        status_col, amount_col = HEADERS.index("Статус"), HEADERS.index("Сумма")
+        for row in reader:
+            if rng.random() < ratio:
+                row[status_col] = rng.choice(("Отменен", "Возврат"))
+                row[amount_col] = _money(rng.uniform(1_000, 150_000), rng)
+                changed += 1
+            writer.writerow(row)
+    return TenantExport(tenant=export.tenant, path=path, orders=changed, skus=export.skus)
+
+
+def generate(out_dir: Path, tenants: int, skus: int, orders: int, seed: int = 42, **kwargs) -> List[TenantExport]:
+    out_dir.mkdir(parents=True, exist_ok=True)
+    return [generate_tenant(t, out_dir, skus, orders, seed=seed, **kwargs) for t in range(1, tenants + 1)]
@@ -0,0 +1,349 @@
+"""Сценарии: импорт (первый, повторный, 304, с изменениями), дашборд по окнам, список товаров,
+200 одновременных запросов дашборда, авторизация и шторм логинов.
+
+Результат - JSON с метаданными (коммит, база, параметры) для сравнения через benchmarks.compare.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+
+def _summary(samples: list) -> dict:
+    ms = sorted(s * 1000 for s in samples)
+    pick = lambda q: ms[min(len(ms) - 1, int(round(q * (len(ms) - 1))))]
+    return {
+        "n": len(ms),
+        "mean_ms": round(statistics.fmean(ms), 3),
+        "p50_ms": round(pick(0.50), 3),
+        "p95_ms": round(pick(0.95), 3),
+        "p99_ms": round(pick(0.99), 3),
+        "max_ms": round(ms[-1], 3),
+    }
+
+
+async def _timed(samples: list, coro):
+    started = time.perf_counter()
+    result = await coro
+    samples.append(time.perf_counter() - started)
+    return result
+
+
+def _git_commit() -> dict:
+    def git(*args):
+        return subprocess.run(["git", *args], capture_output=True, text=True, cwd=Path(__file__).parent).stdout.strip()
+    try:
+        return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+    except OSError:
+        return {"commit": None, "dirty": None}
+
+
+async def setup_database(engine, Base) -> None:
+    async with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            await conn.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        await conn.run_sync(Base.metadata.create_all)
+
+
+async def create_users(count: int, prefix: str = "bench") -> list:
+    from app.core.security import get_password_hash
+    from app.database import AsyncSessionLocal
+    from app.models import CompanySettings, User
+
+    users = []
+    hashed_password = get_password_hash("bench")
+    async with AsyncSessionLocal() as db:
+        for n in range(1, count + 1):
+            user = User(email=f"{prefix}{n}@example.kz", hashed_password=hashed_password)
+            db.add(user)
+            await db.flush()
+            db.add(CompanySettings(user_id=user.id, tax_percent=3.0))
+            users.append(user.id)
+        await db.commit()
+    return users
+
+
+async def bench_sync(exports, changed_exports, base_url: str, user_ids: list) -> dict:
+    from app.database import AsyncSessionLocal
+    from app.services.importer import sync_kaspi_data
+
+    passes = {}
+    # first - пустая база, resync - та же выгрузка (все строки совпадают), conditional - ответ 304,
+    # resync_changed - у части заказов другие статус и сумма (массовый UPDATE)
+    for name, conditional, files in (
+        ("first", False, exports),
+        ("resync", False, exports),
+        ("conditional", True, exports),
+        ("resync_changed", False, changed_exports),
+    ):
+        runs = []
+        for export, user_id in zip(files, user_ids):
+            async with AsyncSessionLocal() as db:
+                started = time.perf_counter()
+                result = await sync_kaspi_data(f"{base_url}/{export.path.name}", user_id, db, conditional=conditional)
+                elapsed = time.perf_counter() - started
+            if "error" in result:
+                raise RuntimeError(result["error"])
+            runs.append({
+                "rows": result.get("rows", 0),
+                "elapsed_sec": round(elapsed, 3),
+                "rows_per_sec": round(result.get("rows", 0) / elapsed, 1),
+                "imported": result.get("imported", 0),
+                "changed": result.get("changed", 0),
+                "unchanged": result.get("unchanged", 0),
+                "statements": result.get("statements", 0),
+                "stages_sec": result.get("stages_sec", {}),
+                "status": result["status"],
+            })
+        total_rows = sum(r["rows"] for r in runs)
+        total_sec = sum(r["elapsed_sec"] for r in runs)
+        passes[name] = {
+            "rows": total_rows,
+            "elapsed_sec": round(total_sec, 3),
+            "rows_per_sec": round(total_rows / total_sec, 1) if total_sec else 0.0,
+            "tenants": runs,
+        }
+    return passes
+
+
+async def bench_dashboard(client, headers: dict, user_id: int, windows, repeat: int) -> dict:
+    from app.services.cache import dashboard_cache
+
+    results = {}
+    for days in windows:
+        cold, warm = [], []
+        for _ in range(repeat):
+            await dashboard_cache.invalidate(user_id)
+            await _timed(cold, client.get("/api/v1/analytics/dashboard", params={"days": days}, headers=headers))
+            response = await _timed(warm, client.get("/api/v1/analytics/dashboard", params={"days": days}, headers=headers))
+        results[f"days_{days}"] = {
+            "cold": _summary(cold),
+            "warm": _summary(warm),
+            # Для сверки: одинаковые данные должны давать одинаковые итоги на любом коммите
+            "total_orders": response.json()["total_orders"],
+        }
+    return results
+
+
+async def bench_dashboard_concurrent(client, headers: dict, user_id: int, days: int, concurrency: int) -> dict:
+    """concurrency одновременных запросов дашборда: cold - кэш сброшен (все идут в базу
+    и делят пул соединений), warm - сразу следом, из кэша."""
+    from app.database import pool_status
+    from app.services.cache import dashboard_cache
+
+    async def burst() -> dict:
+        samples, statuses = [], {}
+
+        async def one():
+            response = await _timed(samples, client.get("/api/v1/analytics/dashboard", params={"days": days}, headers=headers))
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        return {
+            **_summary(samples),
+            "requests_per_sec": round(concurrency / elapsed, 1),
+            "status": {str(code): count for code, count in sorted(statuses.items())},
+        }
+
+    await dashboard_cache.invalidate(user_id)
+    cold = await burst()
+    warm = await burst()
+    return {"days": days, "cold": cold, "warm": warm, "pool_after": pool_status()}
+
+
+async def bench_products(client, headers: dict, sku_prefix: str, repeat: int) -> dict:
+    first_page, prefix, exact = [], [], []
+    walk_started = time.perf_counter()
+    pages, cursor = 0, None
+    while True:
+        params = {"limit": 100, **({"cursor": cursor} if cursor else {})}
+        response = await client.get("/api/v1/products/", params=params, headers=headers)
+        pages += 1
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    walk_sec = time.perf_counter() - walk_started
+
+    for _ in range(repeat):
+        await _timed(first_page, client.get("/api/v1/products/", params={"limit": 100}, headers=headers))
+        await _timed(prefix, client.get("/api/v1/products/", params={"limit": 100, "sku_prefix": sku_prefix}, headers=headers))
+        await _timed(exact, client.get("/api/v1/products/", params={"limit": 100, "count": "exact"}, headers=headers))
+    return {
+        "first_page": _summary(first_page),
+        "sku_prefix": _summary(prefix),
+        "exact_count": _summary(exact),
+        "walk_all": {"pages": pages, "elapsed_sec": round(walk_sec, 3)},
+    }
+
+
+async def bench_auth(client, email: str, repeat: int) -> dict:
+    login, authed = [], []
+    token = None
+    for _ in range(repeat):
+        response = await _timed(login, client.post("/api/v1/auth/token", data={"username": email, "password": "bench"}))
+        token = response.json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    for _ in range(repeat * 10):
+        await _timed(authed, client.get("/api/v1/analytics/settings", headers=headers))
+    return {"login": _summary(login), "authenticated_request": _summary(authed), "token": token}
+
+
+async def bench_login_storm(client, headers: dict, emails: list, logins: int, concurrency: int, probes: int) -> dict:
+    """Шторм логинов (bcrypt в пуле потоков) и параллельно - обычные запросы с токеном.
+    Если хэширование держит event loop, p99 probe.during_storm уходит в сотни мс."""
+    probe_url = "/api/v1/analytics/settings"
+    baseline, during, login_times = [], [], []
+    statuses = {}
+    for _ in range(probes):
+        await _timed(baseline, client.get(probe_url, headers=headers))
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def login(n: int):
+        async with semaphore:
+            data = {"username": emails[n % len(emails)], "password": "bench"}
+            response = await _timed(login_times, client.post("/api/v1/auth/token", data=data))
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    storm = asyncio.gather(*(login(n) for n in range(logins)))
+    started = time.perf_counter()
+    while not storm.done():
+        await _timed(during, client.get(probe_url, headers=headers))
+    await storm
+    storm_sec = time.perf_counter() - started
+    return {
+        "probe": {"baseline": _summary(baseline), "during_storm": _summary(during)},
+        "login": _summary(login_times),
+        "logins_per_sec": round(logins / storm_sec, 1),
+        "login_status": {str(code): count for code, count in sorted(statuses.items())},
+    }
+
+
+async def run(args) -> dict:
+    import httpx
+
+    from app.config import settings
+    from app.database import Base, engine
+    from app.main import app
+    from app.services.downloader import close_client
+    from benchmarks.generator import generate, mutate
+    from benchmarks.server import serve_directory
+
+    data_dir = Path(tempfile.mkdtemp(prefix="kaspi-bench-"))
+    started = time.perf_counter()
+    # Даты отсчитываем от сегодняшнего дня: окна дашборда (последние N дней) видят те же доли заказов
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    exports = generate(data_dir, args.tenants, args.skus, args.orders, seed=args.seed, now=today)
+    changed_exports = [mutate(export, seed=args.seed) for export in exports]
+    generate_sec = time.perf_counter() - started
+
+    server, base_url = serve_directory(data_dir)
+    try:
+        await setup_database(engine, Base)
+        user_ids = await create_users(args.tenants)
+        scenarios = {"generate": {"elapsed_sec": round(generate_sec, 3)}}
+        scenarios["sync"] = await bench_sync(exports, changed_exports, base_url, user_ids)
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            auth = await bench_auth(client, "bench1@example.kz", args.repeat)
+            headers = {"Authorization": f"Bearer {auth.pop('token')}"}
+            scenarios["auth"] = auth
+            # Аккаунтов столько, чтобы лимит попыток на аккаунт не срабатывал: меряем bcrypt, а не 429
+            accounts = -(-args.storm_logins // settings.LOGIN_MAX_ATTEMPTS)
+            await create_users(accounts, prefix="storm")
+            emails = [f"storm{n}@example.kz" for n in range(1, accounts + 1)]
+            scenarios["login_storm"] = await bench_login_storm(
+                client, headers, emails, args.storm_logins, args.storm_concurrency, args.repeat * 10,
+            )
+            scenarios["dashboard"] = await bench_dashboard(client, headers, user_ids[0], args.windows, args.repeat)
+            scenarios["dashboard_concurrent"] = await bench_dashboard_concurrent(
+                client, headers, user_ids[0], max(args.windows), args.concurrency,
+            )
+            scenarios["products"] = await bench_products(client, headers, exports[0].skus[0][:-2], args.repeat)
+    finally:
+        server.shutdown()
+        await close_client()
+        await engine.dispose()
+
+    return {
+        "meta": {
+            **_git_commit(),
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "database": engine.dialect.name,
+            "params": {
+                "tenants": args.tenants, "skus": args.skus, "orders": args.orders,
+                "seed": args.seed, "repeat": args.repeat, "windows": args.windows,
+                "storm_logins": args.storm_logins, "storm_concurrency": args.storm_concurrency,
+                "concurrency": args.concurrency,
+            },
+        },
+        "scenarios": scenarios,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run")
+    parser.add_argument("--database-url", help="По умолчанию - временная SQLite")
+    parser.add_argument("--tenants", type=int, default=2)
+    parser.add_argument("--skus", type=int, default=200)
+    parser.add_argument("--orders", type=int, default=20000, help="Заказов на пользователя")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--windows", type=int, nargs="+", default=[7, 30, 90, 365])
+    parser.add_argument("--concurrency", type=int, default=200, help="Одновременных запросов дашборда")
+    parser.add_argument("--storm-logins", type=int, default=200, help="Логинов в шторме")
+    parser.add_argument("--storm-concurrency", type=int, default=50)
+    parser.add_argument("--out", type=Path, help="Куда писать JSON (по умолчанию benchmarks/results/)")
+    args = parser.parse_args()
+
+    # Настройки читаются при импорте app - окружение выставляем до него
+    database_url = args.database_url or "sqlite+aiosqlite:///" + os.path.join(tempfile.mkdtemp(prefix="kaspi-bench-db-"), "bench.db")
+    os.environ["DATABASE_URL"] = database_url
+    os.environ["AUTO_SYNC_ENABLED"] = "false"
+
+    result = asyncio.run(run(args))
+
+    out = args.out
+    if out is None:
+        commit = (result["meta"]["commit"] or "nogit")[:8]
+        out = RESULTS_DIR / f"{datetime.utcnow():%Y%m%dT%H%M%S}_{commit}_{result['meta']['database']}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    sync = result["scenarios"]["sync"]
+    print(
+        f"sync first: {sync['first']['rows_per_sec']} rows/s, resync: {sync['resync']['rows_per_sec']} rows/s, "
+        f"resync with changes: {sync['resync_changed']['rows_per_sec']} rows/s"
+    )
+    for window, stats in result["scenarios"]["dashboard"].items():
+        print(f"dashboard {window}: cold p50 {stats['cold']['p50_ms']} ms, warm p50 {stats['warm']['p50_ms']} ms")
+    burst = result["scenarios"]["dashboard_concurrent"]
+    print(
+        f"dashboard x{args.concurrency} concurrent: cold p99 {burst['cold']['p99_ms']} ms "
+        f"({burst['cold']['requests_per_sec']} req/s), warm p99 {burst['warm']['p99_ms']} ms"
+    )
+    storm = result["scenarios"]["login_storm"]
+    print(
+        f"login storm: probe p99 {storm['probe']['baseline']['p99_ms']} ms -> "
+        f"{storm['probe']['during_storm']['p99_ms']} ms, {storm['logins_per_sec']} logins/s"
+    )
+    print(f"results: {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""Локальная замена Google Sheets: отдает CSV из каталога, с ETag / Last-Modified и 304."""
+import hashlib
+import threading
+from email.utils import formatdate
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Tuple
+
+
+class _CsvHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        path = Path(self.translate_path(self.path))
+        if not path.is_file():
+            self.send_error(404)
+            return
+        body = path.read_bytes()
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/csv; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", formatdate(path.stat().st_mtime, usegmt=True))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve_directory(directory: Path) -> Tuple[ThreadingHTTPServer, str]:
+    """Запускает сервер в фоновом потоке. Возвращает (server, base_url); остановка - server.shutdown()."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(_CsvHandler, directory=str(directory)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
@@ -0,0 +1,160 @@
+"""Агрегат дашборда в SQL (daily_stats_query + build_dashboard) против прежнего цикла по заказам.
+
+Гоняется на SQLite: python -m pytest tests
+"""
+import asyncio
+import os
+import random
+from datetime import datetime, timedelta
+
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite://")
+os.environ.setdefault("AUTO_SYNC_ENABLED", "false")
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+from sqlalchemy.future import select  # noqa: E402
+
+from app.database import Base  # noqa: E402
+from app.models import Order, Product, User  # noqa: E402
+from app.schemas import DailyStats, DashboardStats  # noqa: E402
+from app.services.stats import (  # noqa: E402
+    EXCLUDED_STATUSES, build_dashboard, daily_stats_query, products_without_costs_query,
+)
+
+TAX_PERCENT = 3.0
+NOW = datetime(2026, 3, 15, 18, 30)
+
+
+def reference_dashboard(orders, products, start_date):
+    """Цикл из старого get_dashboard_stats. Отличия - только принятые позже: товар ищем у того же
+    пользователя, в расходы на штуку входит other_expenses, products_without_costs - число товаров."""
+    by_sku = {(p.user_id, p.sku): p for p in products}
+    total_revenue = 0.0
+    total_profit = 0.0
+    total_orders = 0
+    orders_without_costs = 0
+    daily_map = {}
+
+    for order in orders:
+        if order.order_date < start_date or order.status in EXCLUDED_STATUSES:
+            continue
+        product = by_sku.get((order.user_id, order.sku))
+
+        total_orders += 1
+        revenue = order.amount
+        total_revenue += revenue
+        qty = order.quantity if order.quantity and order.quantity > 0 else 1
+
+        total_cogs = 0.0
+        if product:
+            purchase = product.purchase_price or 0
+            unit_cost = (
+                purchase + (product.logistics_china or 0) + (product.logistics_inner or 0)
+                + (product.packaging_cost or 0) + (product.other_expenses or 0)
+            )
+            total_cogs = unit_cost * qty
+            total_cogs += revenue * ((product.kaspi_commission or 0) / 100)
+            if purchase == 0:
+                orders_without_costs += 1
+        else:
+            orders_without_costs += 1
+
+        tax_amount = revenue * (TAX_PERCENT / 100)
+        delivery_kaspi = order.delivery_cost_for_seller or 0
+        profit = revenue - total_cogs - tax_amount - delivery_kaspi
+        total_profit += profit
+
+        day = daily_map.setdefault(order.order_date.date(), {"revenue": 0.0, "profit": 0.0, "count": 0})
+        day["revenue"] += revenue
+        day["profit"] += profit
+        day["count"] += 1
+
+    margin = (total_profit / total_revenue * 100) if total_revenue > 0 else 0
+    total_expenses = total_revenue - total_profit
+    roi = (total_profit / total_expenses * 100) if total_expenses > 0 else 0
+    stats = DashboardStats(
+        total_revenue=round(total_revenue, 2),
+        total_profit=round(total_profit, 2),
+        total_orders=total_orders,
+        margin_percent=round(margin, 2),
+        roi_percent=round(roi, 2),
+        chart_data=[
+            DailyStats(
+                date=day,
+                revenue=round(daily_map[day]["revenue"], 2),
+                profit=round(daily_map[day]["profit"], 2),
+                orders_count=daily_map[day]["count"],
+            )
+            for day in sorted(daily_map)
+        ],
+        products_without_costs=sum(1 for p in products if p.user_id == 1 and not (p.purchase_price or 0)),
+    )
+    return stats, orders_without_costs
+
+
+def seed(rng: random.Random):
+    products = [
+        Product(
+            user_id=user_id, sku=f"S{n}", name=f"Товар {n}",
+            purchase_price=rng.choice([None, 0.0, 1500.0, 12990.5]),
+            logistics_china=rng.choice([None, 0.0, 350.25]),
+            logistics_inner=rng.choice([None, 120.0]),
+            packaging_cost=rng.choice([None, 45.5]),
+            other_expenses=rng.choice([None, 0.0, 80.0]),
+            kaspi_commission=rng.choice([None, 8.5, 12.0]),
+        )
+        # У второго пользователя те же SKU с другой себестоимостью - не должны смешиваться
+        for user_id in (1, 2)
+        for n in range(30)
+    ]
+    orders = [
+        Order(
+            user_id=rng.choice([1, 1, 1, 2]),
+            kaspi_id=str(n),
+            sku=f"S{rng.randint(0, 35)}",  # S30..S35 - товара нет
+            amount=round(rng.uniform(500, 90000), 2),
+            status=rng.choice(["Выдан", "Выдан", "Новый", "Отменен", "Возврат", None]),
+            order_date=NOW - timedelta(minutes=rng.randint(0, 60 * 24 * 120)),
+            quantity=rng.choice([None, 0, 1, 1, 2, 5]),
+            delivery_cost_for_seller=rng.choice([None, 0.0, 990.0, 2500.0]),
+        )
+        for n in range(3000)
+    ]
+    return products, orders
+
+
+async def _dashboard_from_sql(tmp_path, start_date):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'stats.db'}")
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        products, orders = seed(random.Random(5))
+        session = async_sessionmaker(engine, expire_on_commit=False)
+        async with session() as db:
+            db.add_all([User(id=1, email="a@example.kz", hashed_password="x"),
+                        User(id=2, email="b@example.kz", hashed_password="x")])
+            db.add_all(products + orders)
+            await db.commit()
+
+            rows = (await db.execute(daily_stats_query(1, TAX_PERCENT, start_date))).all()
+            without_costs = await db.scalar(products_without_costs_query(1))
+            stored = (await db.execute(select(Order).where(Order.user_id == 1).order_by(Order.id))).scalars().all()
+        return build_dashboard(rows, without_costs), rows, products, stored
+    finally:
+        await engine.dispose()
+
+
+def test_sql_dashboard_matches_python_loop(tmp_path):
+    start_date = NOW - timedelta(days=90)
+    stats, rows, products, orders = asyncio.run(_dashboard_from_sql(tmp_path, start_date))
+    expected, orders_without_costs = reference_dashboard(orders, products, start_date)
+
+    assert stats.total_orders > 0
+    assert stats.total_revenue == expected.total_revenue
+    assert stats.total_profit == expected.total_profit
+    assert stats.total_orders == expected.total_orders
+    assert stats.margin_percent == expected.margin_percent
+    assert stats.roi_percent == expected.roi_percent
+    assert stats.chart_data == expected.chart_data
+    assert stats.products_without_costs == expected.products_without_costs
+    # Построчный признак "нет себестоимости" (колонка without_costs итогов по дням)
+    assert sum(row.without_costs for row in rows) == orders_without_costs
@@ -0,0 +1,126 @@
+"""Повторный синк (sync_kaspi_data): новые, измененные и неизменные заказы - свежие и старые.
+
+Гоняется на SQLite: python -m pytest tests
+"""
+import asyncio
+import csv
+import os
+from datetime import datetime, timedelta
+
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite://")
+os.environ.setdefault("AUTO_SYNC_ENABLED", "false")
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+from sqlalchemy.future import select  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from app.database import Base  # noqa: E402
+from app.models import DailyStat, Order, User  # noqa: E402
+from app.services.downloader import close_client  # noqa: E402
+from app.services.importer import COLUMN_MAP, sync_kaspi_data  # noqa: E402
+from benchmarks.server import serve_directory  # noqa: E402
+
+NOW = datetime(2026, 3, 15, 18, 30)
+OLD = NOW - timedelta(days=200)  # Далеко за последней датой прошлого синка
+
+
+def order(kaspi_id, order_date, amount=10000.0, status="Выдан"):
+    return {
+        "kaspi_id": kaspi_id, "sku": "S1", "amount": amount, "status": status,
+        "order_date": order_date, "delivery_cost": 990.0, "product_name": "Товар", "quantity": 1,
+    }
+
+
+def write_export(path, orders):
+    with path.open("w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(list(COLUMN_MAP))
+        for row in orders:
+            writer.writerow([
+                row[field].strftime("%d.%m.%Y %H:%M") if field == "order_date" else row[field]
+                for field in COLUMN_MAP.values()
+            ])
+
+
+async def _sync_all(tmp_path, exports):
+    """Каждая выгрузка - очередной синк той же таблицы. Возвращает ответы синков, заказы и итоги по дням."""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'import.db'}")
+    server, base_url = serve_directory(tmp_path)
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session = async_sessionmaker(engine, expire_on_commit=False)
+        async with session() as db:
+            db.add(User(id=1, email="a@example.kz", hashed_password="x"))
+            await db.commit()
+
+        results = []
+        for orders in exports:
+            write_export(tmp_path / "export.csv", orders)
+            async with session() as db:
+                results.append(await sync_kaspi_data(f"{base_url}/export.csv", 1, db))
+        async with session() as db:
+            stored = (await db.execute(select(Order).where(Order.user_id == 1))).scalars().all()
+            days = (await db.execute(select(DailyStat).where(DailyStat.user_id == 1))).scalars().all()
+        return results, {o.kaspi_id: o for o in stored}, {d.day: d for d in days}
+    finally:
+        server.shutdown()
+        await close_client()
+        await engine.dispose()
+
+
+def test_resync_checks_old_and_recent_orders(tmp_path):
+    first = [
+        order("1", OLD), order("2", OLD + timedelta(hours=1)),
+        order("3", NOW), order("4", NOW - timedelta(hours=1)),
+    ]
+    second = [
+        order("1", OLD),                                      # старый, не изменился
+        order("2", OLD + timedelta(hours=1), status="Возврат"),  # старый, сменил статус
+        order("5", OLD - timedelta(days=1)),                  # старый, раньше не выгружался
+        order("3", NOW),                                      # свежий, не изменился
+        order("4", NOW - timedelta(hours=1), amount=7500.0),  # свежий, сменил сумму
+        order("6", NOW - timedelta(hours=2)),                 # свежий, новый
+    ]
+    results, stored, days = asyncio.run(_sync_all(tmp_path, [first, second]))
+
+    assert results[0]["status"] == "success"
+    assert results[0]["imported"] == 4
+    assert results[1]["imported"] == 2
+    assert results[1]["changed"] == 2
+    assert results[1]["unchanged"] == 2
+
+    assert set(stored) == {"1", "2", "3", "4", "5", "6"}
+    assert stored["2"].status == "Возврат"
+    assert stored["4"].amount == 7500.0
+    # Итоги по дням пересчитаны и за старые дни: возврат не в счет, новый заказ добавился
+    assert days[OLD.date()].orders_count == 1
+    assert days[(OLD - timedelta(days=1)).date()].orders_count == 1
+    assert days[NOW.date()].orders_count == 3
+    assert days[NOW.date()].revenue == 27500.0
+
+
+def test_duplicate_kaspi_id_across_chunks(tmp_path, monkeypatch):
+    # По две строки в куске: повтор заказа "1" попадает в следующий кусок, "2" - в третий
+    monkeypatch.setattr(settings, "IMPORT_CHUNK_ROWS", 2)
+    export = [
+        order("1", NOW), order("2", NOW),
+        order("3", NOW), order("1", NOW, amount=1.0),
+        order("2", NOW, status="Отменен"),
+    ]
+    changed = [
+        order("1", NOW, amount=8000.0), order("2", NOW),
+        order("3", NOW, status="Возврат"), order("1", NOW, amount=1.0),
+        order("2", NOW, status="Отменен"),
+    ]
+    results, stored, days = asyncio.run(_sync_all(tmp_path, [export, export, changed]))
+
+    assert [r["imported"] for r in results] == [3, 0, 0]
+    # Повторы не перезаписывают заказ и не считаются измененными на каждом синке
+    assert [r["changed"] for r in results] == [0, 0, 2]
+    assert [r["unchanged"] for r in results] == [0, 3, 1]
+    assert stored["1"].amount == 8000.0
+    assert stored["2"].status == "Выдан"
+    assert stored["3"].status == "Возврат"
+    assert days[NOW.date()].orders_count == 2
+    assert days[NOW.date()].revenue == 18000.0